@@ -0,0 +1,291 @@
+import io
+import json
+import random
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import numpy as np
+from twisted.internet import reactor
+from twisted.internet.task import deferLater
+from daisys.v1.speak.models import Status
+
+from libs.asr import Segment, to_whisper_input
+
+# Local stand-ins for everything main.py talks to over the network (and for
+# the microphone), each with latencies that can be dialled in per run.
+
+CANNED_REPLY = (
+    "That is a good question. Look at the first row, there is only one place left for a three. "
+    "Try it and tell me how it goes!"
+)
+
+
+class _ChatHandler(BaseHTTPRequestHandler):
+    # Speaks just enough of the OpenAI REST API for main.py
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        time.sleep(self.server.latency["request"])
+        model = self.path.rstrip("/").split("/")[-1]
+        self._send_json({"id": model, "object": "model", "created": 0, "owned_by": "bench"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        latency = self.server.latency
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+        words = CANNED_REPLY.split(" ")
+        usage = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_chars // 4 + len(words),
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        self.server.requests += 1
+
+        time.sleep(latency["first_token"])
+        if random.random() < latency["tail_fraction"]:
+            time.sleep(latency["tail_delay"])
+        if not request.get("stream"):
+            time.sleep(latency["per_token"] * len(words))
+            self._send_json({
+                "id": "bench", "object": "chat.completion", "created": 0, "model": request.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": CANNED_REPLY}}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def event(choices, usage=None):
+            body = {"id": "bench", "object": "chat.completion.chunk", "created": 0,
+                    "model": request.get("model"), "choices": choices, "usage": usage}
+            self.wfile.write(b"data: " + json.dumps(body).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        for i, word in enumerate(words):
+            delta = word if i == 0 else " " + word
+            event([{"index": 0, "delta": {"content": delta}, "finish_reason": None}])
+            time.sleep(latency["per_token"])
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        event([], usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class _QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Hedged requests that lost the race hang up on purpose
+        pass
+
+
+class FakeOpenAIServer:
+    """Chat completions (plain and streamed) and model lookups on localhost.
+
+    tail_fraction of the completions stall for another tail_delay seconds
+    before the first token, like the slow requests of a real provider.
+    """
+    def __init__(self, first_token=0.4, per_token=0.02, request=0.05, tail_fraction=0.0, tail_delay=5.0):
+        self.server = _QuietServer(("127.0.0.1", 0), _ChatHandler)
+        self.server.latency = {"first_token": first_token, "per_token": per_token, "request": request,
+                               "tail_fraction": tail_fraction, "tail_delay": tail_delay}
+        self.server.requests = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:%d/v1" % self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def silent_wav(seconds, rate=22050):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.zeros(int(seconds * rate), dtype="<i2").tobytes())
+    return buf.getvalue()
+
+
+class FakeDaisysClient:
+    # generate_take/get_take_audio with a fixed delay plus a delay per character,
+    # and a stall of tail_delay for tail_fraction of the takes. Like the SDK,
+    # generate_take gives up after timeout seconds with a take that is not ready.
+    def __init__(self, take_latency=0.3, per_char=0.004, audio_latency=0.1, seconds_per_char=0.06,
+                 tail_fraction=0.0, tail_delay=5.0):
+        self.take_latency = take_latency
+        self.tail_fraction = tail_fraction
+        self.tail_delay = tail_delay
+        self.per_char = per_char
+        self.audio_latency = audio_latency
+        self.seconds_per_char = seconds_per_char
+        self.takes = {}
+
+    def get_voices(self):
+        return [SimpleNamespace(voice_id="bench-voice", name="Bench")]
+
+    def generate_take(self, voice_id, text, prosody=None, timeout=None):
+        delay = self.take_latency + self.per_char * len(text)
+        if random.random() < self.tail_fraction:
+            delay += self.tail_delay
+        ready = not timeout or delay <= timeout
+        time.sleep(delay if ready else timeout)
+        take_id = "take-%d" % len(self.takes)
+        self.takes[take_id] = text
+        return SimpleNamespace(take_id=take_id, status=Status.READY if ready else Status.STARTED)
+
+    def get_take_audio(self, take_id, file=None, format="wav"):
+        time.sleep(self.audio_latency)
+        audio = silent_wav(len(self.takes[take_id]) * self.seconds_per_char)
+        if file:
+            with open(file, "wb") as f:
+                f.write(audio)
+        return audio
+
+
+class FakeRobotSession:
+    """Stands in for the WAMP session of the robot.
+
+    audio.play with sync=True and say_animated take as long as the robot
+    would need to say them (scaled by speed), plus a network round-trip.
+    """
+    def __init__(self, round_trip=0.03, seconds_per_word=0.35, speed=1.0):
+        self.round_trip = round_trip
+        self.seconds_per_word = seconds_per_word
+        self.speed = speed
+        self.calls = []
+
+    def call(self, procedure, **kwargs):
+        self.calls.append(procedure)
+        duration = 0.0
+        if procedure == "rom.actuator.audio.play" and kwargs.get("sync"):
+            duration = len(kwargs["data"]) / 4 / kwargs["rate"]
+        elif procedure == "rie.dialogue.say_animated":
+            duration = len(kwargs["text"].split()) * self.seconds_per_word
+        return deferLater(reactor, self.round_trip + duration / self.speed, lambda: None)
+
+    def leave(self):
+        pass
+
+
+class ReplayRecorder:
+    """Plays a WAV file in place of the microphone.
+
+    Behaves like libs.capture.Recorder: record() blocks for as long as the
+    recording lasts (divided by speed) while live_audio() grows, so the
+    streaming transcriber sees the same partial audio it would live.
+    """
+    def __init__(self, path, sample_rate=16000, speed=1.0, pause=0.5):
+        import soundfile as sf
+        data, rate = sf.read(path, dtype="float32")
+        self.audio = to_whisper_input(data, rate)
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.pause = pause
+        self.position = 0
+        self.utterance_start = None
+        self.on_utterance_start = None
+        self.on_utterance_end = None
+        self.last_seconds = 0.0
+        self.aborted = threading.Event()
+
+    def abort(self):
+        self.aborted.set()
+
+    def live_audio(self, offset=0):
+        if self.utterance_start is None:
+            return None
+        return self.audio[offset:self.position]
+
+    def record(self, max_seconds=None):
+        self.position = 0
+        self.utterance_start = None
+        if self.aborted.wait(self.pause / self.speed):
+            return self.audio[:0]
+
+        self.utterance_start = 0
+        if self.on_utterance_start is not None:
+            self.on_utterance_start()
+
+        limit = len(self.audio)
+        if max_seconds:
+            limit = min(limit, int(max_seconds * self.sample_rate))
+        step = self.sample_rate // 10
+        while self.position < limit and not self.aborted.is_set():
+            time.sleep(0.1 / self.speed)
+            self.position = min(self.position + step, limit)
+        if self.on_utterance_end is not None and not self.aborted.is_set():
+            self.on_utterance_end()
+        self.last_seconds = self.position / self.sample_rate
+        return self.audio[:self.position]
+
+
+class FakeASR:
+    """transcribe() with the WhisperModel shape and a real-time-factor delay.
+
+    The words of transcript are spread evenly over clip, the audio the
+    ReplayRecorder plays. Each slice handed to transcribe() is looked up in
+    the clip and gets one segment per word whose middle falls inside it,
+    timed relative to the slice, so the streaming transcriber commits and
+    re-reads audio as it would with real speech. Without a clip, or for
+    audio not from it, the whole transcript is one segment.
+    """
+    def __init__(self, transcript="Can you give me a hint for the next move?", fixed=0.08, real_time_factor=0.1,
+                 clip=None, sample_rate=16000):
+        self.transcript = transcript
+        self.words = transcript.split()
+        self.fixed = fixed
+        self.real_time_factor = real_time_factor
+        self.clip = clip
+        self.sample_rate = sample_rate
+
+    def _offset(self, audio):
+        # Where audio starts in the clip, found from its loudest stretch
+        # (stretches of silence are all alike)
+        loudest = int(np.argmax(np.abs(audio)))
+        probe = audio[loudest:loudest + 256]
+        for start in np.flatnonzero(self.clip == audio[loudest]) - loudest:
+            if start >= 0 and np.array_equal(self.clip[start + loudest:start + loudest + len(probe)], probe):
+                return int(start)
+        return None
+
+    def transcribe(self, audio, **options):
+        audio = np.asarray(audio)
+        seconds = len(audio) / self.sample_rate
+        time.sleep(self.fixed + seconds * self.real_time_factor)
+        offset = self._offset(audio) if self.clip is not None and len(audio) else None
+        if offset is None:
+            return [Segment(0.0, seconds, self.transcript)], None
+
+        word_seconds = len(self.clip) / self.sample_rate / len(self.words)
+        begin = offset / self.sample_rate
+        segments = []
+        for i, word in enumerate(self.words):
+            if begin <= (i + 0.5) * word_seconds < begin + seconds:
+                start = max(i * word_seconds - begin, 0.0)
+                end = min((i + 1) * word_seconds - begin, seconds)
+                segments.append(Segment(start, end, word))
+        return segments, None
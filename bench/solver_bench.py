@@ -0,0 +1,151 @@
+"""Benchmark the Sudoku solvers behind the hint path and guard against regressions.
+
+Run from the repository root:
+
+    python -m bench.solver_bench                    # compare against the baseline
+    python -m bench.solver_bench --update-baseline  # record a new baseline
+
+Every puzzle in bench/puzzles.txt is solved --repeat times through each
+entry point: the shared solver, sudoku.py's get_next_correct_move_from_board
+and sudoku_context's generate_hint (with a cold hint cache). Per category
+the report gives solves per second, p50/p99 latency and search nodes.
+The run fails (exit status 1) when node counts grow, latency gets worse
+than the baseline by more than --tolerance, or any puzzle goes unsolved.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from libs.tracing import percentile
+from sudoku_context import HintCache, generate_hint
+from sudoku_solver import SolveTimeout, solve_with_stats
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(HERE, "puzzles.txt")
+BASELINE = os.path.join(HERE, "solver_baseline.json")
+
+
+def load_corpus(path=CORPUS):
+    puzzles = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            category, cells = line.split()
+            digits = [int(c) if c.isdigit() else 0 for c in cells]
+            if len(digits) != 81:
+                raise ValueError("Puzzle must have 81 cells: " + cells)
+            puzzles.append((category, [digits[r * 9:r * 9 + 9] for r in range(9)]))
+    return puzzles
+
+
+def _solver(board):
+    solved, nodes = solve_with_stats(board)
+    return solved is not None, nodes
+
+
+def _ui_next_move(board):
+    return get_next_correct_move_from_board(board) is not None, None
+
+
+def _hint(board):
+    return generate_hint(board, HintCache()).startswith("A correct move"), None
+
+
+ENTRY_POINTS = [("sudoku_solver.solve", _solver), ("sudoku_context.generate_hint", _hint)]
+
+try:
+    from sudoku import get_next_correct_move_from_board
+    ENTRY_POINTS.insert(1, ("sudoku.get_next_correct_move_from_board", _ui_next_move))
+except ImportError as e:
+    # sudoku.py needs tkinter, which headless machines often lack
+    print("Skipping sudoku.py entry point:", e)
+
+
+def run(puzzles, repeat):
+    results = {}
+    for name, entry in ENTRY_POINTS:
+        for category in sorted({c for c, _ in puzzles}):
+            boards = [b for c, b in puzzles if c == category]
+            latencies = []
+            nodes = []
+            failures = 0
+            for board in boards:
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    try:
+                        ok, count = entry([row[:] for row in board])
+                    except SolveTimeout:
+                        ok, count = False, None
+                    latencies.append(time.perf_counter() - start)
+                    failures += not ok
+                if count is not None:
+                    nodes.append(count)
+
+            results[f"{name}/{category}"] = {
+                "solves_per_second": round(len(latencies) / sum(latencies), 1),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+                "max_nodes": max(nodes) if nodes else None,
+                "total_nodes": sum(nodes) if nodes else None,
+                "failures": failures,
+            }
+    return results
+
+
+def print_results(results):
+    print(f"{'entry point / category':52} {'solves/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'nodes':>7}")
+    for key, r in results.items():
+        nodes = "-" if r["total_nodes"] is None else str(r["total_nodes"])
+        print(f"{key:52} {r['solves_per_second']:9.1f} {r['p50_ms']:8.2f} {r['p99_ms']:8.2f} {nodes:>7}")
+
+
+def compare(results, baseline, tolerance):
+    problems = []
+    for key, r in results.items():
+        if r["failures"]:
+            problems.append(f"{key}: {r['failures']} solves failed or timed out")
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if base["total_nodes"] is not None and r["total_nodes"] is not None \
+                and r["total_nodes"] > base["total_nodes"]:
+            problems.append(f"{key}: nodes {r['total_nodes']} > baseline {base['total_nodes']}")
+        # 1 ms of slack so sub-millisecond easy puzzles do not flap on timer noise
+        if r["p99_ms"] > base["p99_ms"] * tolerance + 1.0:
+            problems.append(f"{key}: p99 {r['p99_ms']}ms > baseline {base['p99_ms']}ms x {tolerance}")
+        if r["solves_per_second"] * tolerance < base["solves_per_second"]:
+            problems.append(f"{key}: {r['solves_per_second']} solves/s < baseline "
+                            f"{base['solves_per_second']} / {tolerance}")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=2.0,
+                        help="allowed slowdown factor for timings, node counts must not grow at all")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = run(load_corpus(), args.repeat)
+    print_results(results)
+
+    if args.update_baseline:
+        with open(BASELINE, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Baseline written to", BASELINE)
+        sys.exit(0)
+
+    if not os.path.exists(BASELINE):
+        print("No baseline yet, run with --update-baseline first.")
+        sys.exit(0)
+
+    with open(BASELINE) as f:
+        problems = compare(results, json.load(f), args.tolerance)
+    for problem in problems:
+        print("REGRESSION:", problem)
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,143 @@
+"""Drive the main.py turn loop end to end against local stand-ins.
+
+Run from the repository root, for example:
+
+    python -m bench.turn_bench --turns 10 --wav temp.wav --daisys
+    python -m bench.turn_bench --no-stream-replies --llm-first-token 1.5
+    python -m bench.turn_bench --sessions 4 --daisys
+
+The microphone is replaced by a WAV file, OpenAI by a local HTTP server,
+Daisys by an in-process client and the robot by a session object that
+takes as long to "play" audio as the robot would. All latencies can be
+set on the command line. With --sessions N, N booths run their turns
+concurrently against the shared ASR, OpenAI and Daisys clients. The
+report gives per-stage p50/p95 timings, the response latency and the
+number of turns per minute.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from twisted.internet import task
+from twisted.internet.defer import gatherResults, inlineCallbacks
+
+import main
+from bench.fakes import FakeASR, FakeDaisysClient, FakeOpenAIServer, FakeRobotSession, ReplayRecorder
+from libs.asr import ASRPool
+from libs.net import pooled_openai
+from libs.tracing import Tracer, percentile
+
+# (label, from stage, to stage), offsets as recorded by libs.tracing
+SPANS = [
+    ("capture", "speech_start", "capture_end"),
+    ("asr after capture", "capture_end", "asr_done"),
+    ("hint after capture", "capture_end", "hint_ready"),
+    ("llm request after capture", "capture_end", "llm_request"),
+    ("llm first token", "llm_request", "llm_first_token"),
+    ("llm complete", "llm_request", "llm_done"),
+    ("tts first audio", "llm_request", "tts_first_audio"),
+    ("response latency", "capture_end", "output_start"),
+    ("playback", "output_start", "output_end"),
+]
+
+
+def configure(args, server):
+    main.STREAMING_ASR = not args.no_streaming_asr
+    main.STREAM_REPLIES = not args.no_stream_replies
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    main.LLMClient = pooled_openai("bench", base_url=server.base_url)
+    if args.real_asr:
+        main.WHISPER_MODEL = ASRPool(args.asr_workers, **main.WHISPER_SETTINGS)
+    else:
+        main.WHISPER_MODEL = FakeASR(clip=ReplayRecorder(args.wav).audio)
+
+    if args.daisys:
+        main.DAISYS_CLIENT = FakeDaisysClient(take_latency=args.tts_latency, tail_fraction=args.tail_fraction,
+                                              tail_delay=args.tail_delay)
+        main.DAISYS_VOICE = main.DAISYS_CLIENT.get_voices()[0]
+        main.TTS_CACHE = None
+
+    directory = tempfile.mkdtemp(prefix="turn_bench_")
+    sessions = []
+    for n in range(args.sessions):
+        session = main.Session("bench%d" % (n + 1), realm=None, task=args.task, use_daisys=args.daisys)
+        session.current_phase = 1
+        session.recorder = ReplayRecorder(args.wav, speed=args.speed)
+        session.tracer = Tracer(directory, name=session.name)
+        sessions.append(session)
+    return sessions
+
+
+def report(trace_paths, wall_seconds):
+    turns = []
+    for path in trace_paths:
+        with open(path) as f:
+            turns.extend(json.loads(line) for line in f if line.strip())
+    turns = [t for t in turns if not t.get("summary")]
+
+    print(f"\n{len(turns)} turns in {wall_seconds:.1f}s, "
+          f"{len(turns) / wall_seconds * 60:.1f} turns/min\n")
+    print(f"{'stage':28} {'p50 (s)':>9} {'p95 (s)':>9} {'n':>4}")
+    for label, start, end in SPANS:
+        spans = [t["stages"][end] - t["stages"][start] for t in turns
+                 if start in t["stages"] and end in t["stages"]]
+        if not spans:
+            continue
+        print(f"{label:28} {percentile(spans, 50):9.3f} {percentile(spans, 95):9.3f} {len(spans):4d}")
+
+    counts = {}
+    for t in turns:
+        for name, value in t["counts"].items():
+            counts.setdefault(name, []).append(value)
+    for name, values in sorted(counts.items()):
+        print(f"{name:28} {percentile(values, 50):9.2f} {percentile(values, 95):9.2f} {len(values):4d}")
+
+
+@inlineCallbacks
+def _booth(session, args):
+    robot = FakeRobotSession(round_trip=args.robot_rtt, speed=args.speed)
+    for _ in range(args.turns):
+        yield session._turn(robot)
+
+
+@inlineCallbacks
+def run(reactor, args):
+    server = FakeOpenAIServer(first_token=args.llm_first_token, per_token=args.llm_per_token,
+                              tail_fraction=args.tail_fraction, tail_delay=args.tail_delay).start()
+    sessions = configure(args, server)
+    reactor.suggestThreadPoolSize(max(10, 8 * len(sessions)))
+    if args.real_asr:
+        yield main.deferToThread(main.WHISPER_MODEL.wait_ready)
+
+    start = time.perf_counter()
+    yield gatherResults([_booth(session, args) for session in sessions])
+    wall = time.perf_counter() - start
+
+    server.stop()
+    report([session.tracer.path for session in sessions], wall)
+    for stage in (main.LLM_FULL_STAGE, main.LLM_FIRST_TOKEN_STAGE, main.TTS_STAGE, main.SUMMARY_STAGE):
+        print(f"{stage.name}: {stage.calls} calls, {stage.hedged} hedged, {stage.expired} past the deadline")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5, help="turns per session")
+    parser.add_argument("--sessions", type=int, default=1, help="booths running at the same time")
+    parser.add_argument("--wav", default="temp.wav", help="recording replayed as the participant")
+    parser.add_argument("--task", choices=["A", "B"], default="A")
+    parser.add_argument("--daisys", action="store_true", help="speak through the fake Daisys client")
+    parser.add_argument("--real-asr", action="store_true", help="use faster-whisper instead of a fake")
+    parser.add_argument("--asr-workers", type=int, default=main.ASR_WORKERS, help="Whisper processes with --real-asr")
+    parser.add_argument("--no-streaming-asr", action="store_true")
+    parser.add_argument("--no-stream-replies", action="store_true")
+    parser.add_argument("--speed", type=float, default=4.0, help="replay and playback speed-up")
+    parser.add_argument("--llm-first-token", type=float, default=0.4)
+    parser.add_argument("--llm-per-token", type=float, default=0.02)
+    parser.add_argument("--tts-latency", type=float, default=0.3)
+    parser.add_argument("--robot-rtt", type=float, default=0.03)
+    parser.add_argument("--tail-fraction", type=float, default=0.0,
+                        help="share of LLM and Daisys requests that stall for --tail-delay")
+    parser.add_argument("--tail-delay", type=float, default=5.0)
+    task.react(run, [parser.parse_args()])
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import threading
+
+# Line protocol the Sudoku UI pushes to the controller over the subprocess pipe:
+#   board <81 digits>     full board, sent once when the UI starts
+#   cell <row> <col> <v>  a single cell changed, 0 means emptied
+
+
+def encode_board(board):
+    return "board " + "".join(str(d) for row in board for d in row) + "\n"
+
+
+def encode_cell(row, col, value):
+    return "cell %d %d %d\n" % (row, col, value)
+
+
+def write_board_atomic(board, path="sudoku_board.txt"):
+    # Write next to the target and swap it in, so readers never see half a board
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sudoku_board", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            for row in board:
+                f.write("".join(str(num) for num in row) + "\n")
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class BoardMirror:
+    # Controller-side copy of the UI board, kept current by a reader thread.
+    def __init__(self, stream):
+        self.stream = stream
+        self.board = None
+        self.version = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._read, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _read(self):
+        for line in self.stream:
+            parts = line.split()
+            if not parts:
+                continue
+            # A bad line must not end the thread, or the board silently goes stale
+            try:
+                with self.lock:
+                    self._apply(parts)
+            except (ValueError, IndexError):
+                print("Ignoring board message:", line.strip())
+
+    def _apply(self, parts):
+        if parts[0] == "board" and len(parts) == 2 and len(parts[1]) == 81:
+            digits = [int(c) for c in parts[1]]
+            if any(d < 0 or d > 9 for d in digits):
+                raise ValueError("digit out of range")
+            self.board = [digits[r * 9:r * 9 + 9] for r in range(9)]
+            self.version += 1
+        elif parts[0] == "cell" and len(parts) == 4 and self.board is not None:
+            row, col, value = (int(p) for p in parts[1:])
+            if not (0 <= row < 9 and 0 <= col < 9 and 0 <= value <= 9):
+                raise ValueError("cell out of range")
+            if self.board[row][col] != value:
+                self.board[row][col] = value
+                self.version += 1
+        else:
+            raise ValueError("unknown message")
+
+    def get_board(self):
+        with self.lock:
+            if self.board is None:
+                return None
+            return [row[:] for row in self.board]
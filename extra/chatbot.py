@@ -1,19 +1,36 @@
-import numpy as np
-from openai import OpenAI
 import pyaudio
+import atexit
 import io
-import keyboard
-import time
+import queue
+import threading
 import os
-import sounddevice as sd
 import soundfile as sf
 from libs.starttypes import *
+from libs.capture import Recorder
+from libs.sentences import SentenceSplitter
+from libs.tts_cache import TTSCache
+from libs.net import (LLM_FIRST_TOKEN_STAGE, LLM_FULL_STAGE, Stage, complete, complete_stream, hedged,
+                      pooled_openai, request_errors)
 
 LLMClient = False
 sample_rate = 22050  # Samples per second
 channels = 1  # Stereo
 dtype = 'int16'  # Data type for audio
-audio_buffer = []
+listen_mode = "push_to_talk"  # or "vad" to stop recording on silence
+recorder = None
+tts_cache = None
+# Speech output: tts-1 pcm is 16-bit mono at 24 kHz, played on one stream
+# that stays open for the whole run
+OUTPUT_RATE = 24000
+OUTPUT_CHUNK = 4800  # bytes per device write, 0.1 s
+VOICE_ID = "tts-1/alloy"
+audio = None
+output_stream = None
+output_lock = threading.Lock()
+# Deadlines per kind of request; slow ones are sent twice (see libs.net)
+TTS_STAGE = Stage("tts", deadline=8.0, hedge_after=2.0)
+ASR_STAGE = Stage("asr", deadline=8.0, hedge_after=2.0)
+FALLBACK_REPLY = "Sorry, I could not think of an answer in time. Could you ask me again?"
 
 
 def _getOpenAiClient():
@@ -25,86 +42,199 @@ def _getOpenAiClient():
         raise StartError("Start runtime error: to use OpenAI LLM you must set the api key\nWindows: setx OPENAI_API_KEY \"your_api_key_here\" (in your terminal, then restart the terminal) \nLinux: export OPENAI_API_KEY=\"your_api_key_here\"")
 
     if (LLMClient == False):
-        LLMClient= OpenAI(api_key = key)
+        LLMClient = pooled_openai(key)
         
     return LLMClient
 
     
+def _messages(s):
+    return [
+        {"role": "system", "content": ""},
+        {
+            "role": "user",
+            "content": s
+        }
+    ]
+
 def _prompt(s1):
-    completion = _getOpenAiClient().chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": ""},
-            {
-                "role": "user",
-                "content": s1.value
-            }
-        ]
-    )
+    try:
+        completion = complete(_getOpenAiClient(), LLM_FULL_STAGE, _messages(s1.value))
+    except request_errors() as e:
+        print("No reply in time:", e)
+        return text(value=FALLBACK_REPLY)
     return text(value=completion.choices[0].message.content)
 
-def _say(s1):
-    # Initialize PyAudio
-    p = pyaudio.PyAudio()
+def _prompt_sentences(s):
+    # Like _prompt, but yields the reply a sentence at a time as it streams in
+    try:
+        stream = complete_stream(_getOpenAiClient(), LLM_FIRST_TOKEN_STAGE, _messages(s))
+    except request_errors() as e:
+        print("No reply in time:", e)
+        yield FALLBACK_REPLY
+        return
 
-    response = _getOpenAiClient().audio.speech.create(
-        model="tts-1",
-        voice="alloy",
-        input=s1.value,
-        response_format="pcm"
-    )
+    splitter = SentenceSplitter()
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield from splitter.feed(chunk.choices[0].delta.content)
+    except request_errors() as e:
+        print("Reply cut off:", e)
+    finally:
+        stream.close()
+    yield from splitter.flush()
 
-    # Convert response data to audio and play
-    
-    audio_stream = io.BytesIO(response.content)
-
-    stream = p.open(format=p.get_format_from_width(2),  # Assuming 16-bit audio
-                    channels=1,  # Mono audio
-                    rate=24000,  # Typical OpenAI-generated audio sample rate
-                    output=True,)
-    # Play audio
-    stream.write(audio_stream.read())
-    stream.stop_stream()
-    stream.close()
-    
-    # Terminate PyAudio
-    p.terminate()
+def _output():
+    # Opening the device costs more than the first words take to arrive, so
+    # it is done once and the stream is reused for every reply
+    global audio, output_stream
+    with output_lock:
+        if output_stream is None:
+            audio = pyaudio.PyAudio()
+            output_stream = audio.open(format=pyaudio.paInt16,
+                                       channels=1,
+                                       rate=OUTPUT_RATE,
+                                       output=True,
+                                       frames_per_buffer=OUTPUT_CHUNK // 2)
+            atexit.register(_close_output)
+        return output_stream
+
+def _close_output():
+    global audio, output_stream
+    with output_lock:
+        if output_stream is not None:
+            output_stream.stop_stream()
+            output_stream.close()
+            audio.terminate()
+            output_stream = None
+            audio = None
+
+def _open_speech(s):
+    # The response body is read as it arrives; an attempt counts as done once
+    # the headers are in, so the deadline and the hedge cover the time to
+    # first byte. Losing attempts are closed without reading them.
+    client = _getOpenAiClient().with_options(timeout=TTS_STAGE.deadline)
+
+    def attempt():
+        return client.audio.speech.with_streaming_response.create(
+            model="tts-1",
+            voice="alloy",
+            input=s,
+            response_format="pcm"
+        ).__enter__()
+
+    return hedged(TTS_STAGE, attempt, cleanup=lambda response: response.close())
+
+def _speak(s, write):
+    """Synthesise s and hand its PCM to write() as it becomes available.
+
+    Cached speech is written straight away. Otherwise each chunk is written
+    as soon as it is received and the whole take is cached once the stream
+    has completed. Returns False when there was no speech in time.
+    """
+    global tts_cache
+    if tts_cache is None:
+        tts_cache = TTSCache(os.path.join("tts_cache", "chatbot"))
+
+    key = tts_cache.key(VOICE_ID, None, s)
+    cached = tts_cache.get(key)
+    if cached is not None:
+        write(cached[0])
+        return True
+
+    pcm = bytearray()
+    try:
+        response = _open_speech(s)
+        try:
+            for chunk in response.iter_bytes(OUTPUT_CHUNK):
+                write(chunk)
+                pcm += chunk
+        finally:
+            response.close()
+    except request_errors() as e:
+        print("No speech in time:", e)
+        return False
+    tts_cache.put(key, bytes(pcm), OUTPUT_RATE)
+    return True
+
+def _say(s1):
+    if not _speak(s1.value, _output().write):
+        # No voice in time, the text is all there is
+        print("Assistant:", s1.value)
 
 
-def callback(indata, frames, time, status):
-    """Callback function to handle audio chunks."""
-    if status:
-        print(f"Status: {status}")
-    audio_buffer.append(indata.copy())
-    
 def _listen(lenArg):
-    global audio_buffer
-    audio_buffer=[]
-    
-    max_rec_time=lenArg.value
+    global recorder
+    if recorder is None:
+        recorder = Recorder(sample_rate=sample_rate, channels=channels, dtype=dtype, mode=listen_mode)
 
-    while not keyboard.is_pressed('space'):
-        pass
-        
-    while keyboard.is_pressed('space'):
-        pass
-    
-    start_time = time.time()
-    
-    # Create the input stream
-    with sd.InputStream(samplerate=sample_rate, channels=channels, dtype=dtype, callback=callback):
-        while time.time()-start_time<max_rec_time and not keyboard.is_pressed('space'):
-            pass
-            
-    # Combine the recorded chunks into a single NumPy array
-    audio_data = np.concatenate(audio_buffer, axis=0)
-
-    sf.write("temp.wav", audio_data, sample_rate, format="wav")
-     
-    client = _getOpenAiClient()
-
-    transcript = client.audio.translations.create(
-      model="whisper-1",
-      file=open("temp.wav", "rb")
-    )
+    # Blocks on the hotkey or on end of speech, no busy waiting
+    audio_data = recorder.record(lenArg.value)
+
+    # Encode in memory, the API only needs a named WAV payload
+    wav = io.BytesIO()
+    sf.write(wav, audio_data, sample_rate, format="wav")
+
+    client = _getOpenAiClient().with_options(timeout=ASR_STAGE.deadline)
+
+    try:
+        transcript = hedged(ASR_STAGE, lambda: client.audio.translations.create(
+          model="whisper-1",
+          file=("speech.wav", wav.getvalue())
+        ))
+    except request_errors() as e:
+        print("No transcript in time:", e)
+        return text("")
     return text(transcript.text)
+
+
+def _listen_stage(lenArg, turns, transcripts):
+    try:
+        for _ in range(turns):
+            transcripts.put(_listen(lenArg).value)
+    finally:
+        transcripts.put(None)
+
+def _prompt_stage(transcripts, sentences):
+    try:
+        for heard in iter(transcripts.get, None):
+            if heard.strip():
+                for sentence in _prompt_sentences(heard):
+                    sentences.put(sentence)
+    finally:
+        sentences.put(None)
+
+def _speech_stage(sentences, chunks):
+    try:
+        for sentence in iter(sentences.get, None):
+            if not _speak(sentence, chunks.put):
+                print("Assistant:", sentence)
+    finally:
+        chunks.put(None)
+
+def _converse(lenArg, turnsArg):
+    """Hold turnsArg.value turns of _listen -> _prompt -> _say as overlapping stages.
+
+    Each stage runs in its own thread and hands its output to the next
+    through a short queue, with the device writes on the calling thread:
+    the next utterance is recorded and transcribed while the last reply is
+    still being written, and every sentence of a reply is synthesised and
+    played while the rest of it streams in. Since listening goes on during
+    playback, use push_to_talk (or headphones) rather than vad.
+    """
+    transcripts = queue.Queue(maxsize=1)
+    sentences = queue.Queue(maxsize=4)
+    chunks = queue.Queue(maxsize=16)
+    stages = [
+        threading.Thread(target=_listen_stage, args=(lenArg, turnsArg.value, transcripts), daemon=True),
+        threading.Thread(target=_prompt_stage, args=(transcripts, sentences), daemon=True),
+        threading.Thread(target=_speech_stage, args=(sentences, chunks), daemon=True),
+    ]
+    for stage in stages:
+        stage.start()
+
+    stream = _output()
+    for chunk in iter(chunks.get, None):
+        stream.write(chunk)
+    for stage in stages:
+        stage.join()
@@ -0,0 +1,261 @@
+import multiprocessing
+import queue
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+
+WHISPER_SAMPLE_RATE = 16000
+
+Segment = namedtuple("Segment", ["start", "end", "text"])
+
+
+def to_whisper_input(audio, rate):
+    # faster-whisper takes float32 mono at 16 kHz as-is, anything else is
+    # converted here once instead of being written out and decoded again
+    audio = np.asarray(audio)
+    if audio.ndim > 1:
+        audio = audio[:, 0]
+    if audio.dtype.kind == 'i':
+        audio = audio.astype(np.float32) / np.iinfo(audio.dtype).max
+    elif audio.dtype != np.float32:
+        audio = audio.astype(np.float32)
+
+    if rate != WHISPER_SAMPLE_RATE:
+        from math import gcd
+        from scipy.signal import resample_poly
+        g = gcd(WHISPER_SAMPLE_RATE, rate)
+        audio = resample_poly(audio, WHISPER_SAMPLE_RATE // g, rate // g).astype(np.float32)
+    return audio
+
+
+def _worker_main(settings, requests, responses):
+    # Runs in the worker process: load once, warm up, then serve forever
+    try:
+        from faster_whisper import WhisperModel
+        model = WhisperModel(
+            settings["model_size"],
+            device=settings["device"],
+            compute_type=settings["compute_type"],
+            cpu_threads=settings["cpu_threads"],
+            num_workers=settings["num_workers"]
+        )
+        segments, info = model.transcribe(np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32), beam_size=1)
+        list(segments)
+    except Exception as e:
+        responses.put(e)
+        return
+    responses.put("ready")
+
+    for audio, options in iter(requests.get, None):
+        try:
+            options.setdefault("beam_size", settings["beam_size"])
+            segments, info = model.transcribe(audio, **options)
+            responses.put([Segment(seg.start, seg.end, seg.text) for seg in segments])
+        except Exception as e:
+            responses.put(e)
+
+
+class ASRWorker:
+    """faster-whisper in a long-lived process of its own.
+
+    Nothing is loaded until start() (or the first transcribe()), and the
+    model is warmed up on a second of silence before it reports ready.
+    transcribe() mirrors WhisperModel.transcribe, so either can be handed
+    to StreamingTranscriber. Callers block on a queue, not on the GIL.
+    If the process dies, or takes longer than load_timeout to load or
+    transcribe_timeout to transcribe, the call raises RuntimeError and the
+    next one starts a fresh process.
+    """
+    def __init__(self, model_size="base", device="cpu", compute_type="int8",
+                 cpu_threads=0, num_workers=1, beam_size=5, load_timeout=300, transcribe_timeout=60):
+        self.settings = {
+            "model_size": model_size,
+            "device": device,
+            "compute_type": compute_type,
+            "cpu_threads": cpu_threads,
+            "num_workers": num_workers,
+            "beam_size": beam_size,
+        }
+        self.load_timeout = load_timeout
+        self.transcribe_timeout = transcribe_timeout
+        self.process = None
+        self.ready = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.process is None:
+            self.requests = multiprocessing.Queue()
+            self.responses = multiprocessing.Queue()
+            self.process = multiprocessing.Process(
+                target=_worker_main,
+                args=(self.settings, self.requests, self.responses),
+                daemon=True
+            )
+            self.process.start()
+        return self
+
+    def _reply(self, timeout):
+        # Waits for the worker's answer, checking every second that it is
+        # still there to give one
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.responses.get(timeout=1.0)
+            except queue.Empty:
+                pass
+            if not self.process.is_alive():
+                code = self.process.exitcode
+                self._discard()
+                raise RuntimeError(f"Whisper worker exited with code {code}")
+            if time.monotonic() > deadline:
+                self._discard()
+                raise RuntimeError(f"Whisper worker did not answer within {timeout}s")
+
+    def _discard(self):
+        # Called with the lock held; start() makes a new process next time
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.process = None
+        self.ready = False
+
+    def wait_ready(self):
+        with self.lock:
+            self.start()
+            if not self.ready:
+                reply = self._reply(self.load_timeout)
+                if isinstance(reply, Exception):
+                    self._discard()
+                    raise RuntimeError("Whisper worker failed to start") from reply
+                self.ready = True
+
+    def transcribe(self, audio, **options):
+        self.wait_ready()
+        with self.lock:
+            self.requests.put((np.asarray(audio, dtype=np.float32), options))
+            reply = self._reply(self.transcribe_timeout)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply, None
+
+    def stop(self):
+        if self.process is not None:
+            self.requests.put(None)
+            self.process.join(timeout=5)
+            self.process = None
+            self.ready = False
+
+
+class ASRPool:
+    """A few ASRWorker processes shared by every session in the process.
+
+    transcribe() borrows whichever worker is idle, so concurrent sessions
+    only queue up when all of them are busy. Same interface as ASRWorker.
+    """
+    def __init__(self, size=2, **settings):
+        self.workers = [ASRWorker(**settings) for _ in range(size)]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        return self
+
+    def wait_ready(self):
+        for worker in self.workers:
+            worker.wait_ready()
+
+    def transcribe(self, audio, **options):
+        worker = self.idle.get()
+        try:
+            return worker.transcribe(audio, **options)
+        finally:
+            self.idle.put(worker)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+class StreamingTranscriber:
+    """Transcribes an utterance while it is still being recorded.
+
+    Every step_seconds the audio not yet committed is transcribed again.
+    Segments that end more than keep_seconds before the live edge are
+    committed and never looked at again, so once recording stops only the
+    short uncommitted tail is left to transcribe. Once the uncommitted
+    audio is longer than window_seconds the oldest segment is committed
+    anyway, so the window does not keep growing. An error while recording
+    is raised from transcribe().
+    """
+    def __init__(self, model, step_seconds=1.0, window_seconds=8.0, keep_seconds=1.0,
+                 beam_size=1, on_partial=None):
+        self.model = model
+        self.step_seconds = step_seconds
+        self.window_seconds = window_seconds
+        self.keep_seconds = keep_seconds
+        self.beam_size = beam_size
+        self.on_partial = on_partial
+
+    def _segments(self, audio, rate):
+        segments, info = self.model.transcribe(
+            to_whisper_input(audio, rate),
+            beam_size=self.beam_size,
+            condition_on_previous_text=False
+        )
+        return list(segments)
+
+    def transcribe(self, recorder, max_seconds=None):
+        rate = recorder.sample_rate
+        result = {}
+        done = threading.Event()
+
+        def capture():
+            try:
+                result["audio"] = recorder.record(max_seconds)
+            except Exception as e:
+                result["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=capture, daemon=True).start()
+
+        committed_text = []
+        committed = 0
+        while not done.wait(self.step_seconds):
+            audio = recorder.live_audio(committed)
+            if audio is None or len(audio) < rate // 2:
+                continue
+
+            segments = self._segments(audio, rate)
+            duration = len(audio) / rate
+            horizon = duration - self.keep_seconds
+            if duration > self.window_seconds:
+                # Window is full, commit all but the segment still being spoken,
+                # or that one too when a single segment fills the window
+                horizon = max(horizon, segments[-2].end if len(segments) > 1 else float("inf"))
+
+            stable = [seg for seg in segments if seg.end <= horizon]
+            if stable:
+                committed_text.extend(seg.text.strip() for seg in stable)
+                committed += int(stable[-1].end * rate)
+            elif duration > self.window_seconds:
+                # A full window without any speech in it
+                committed += int((duration - self.keep_seconds) * rate)
+
+            if self.on_partial:
+                pending = [seg.text.strip() for seg in segments if seg not in stable]
+                self.on_partial(" ".join(committed_text + pending))
+
+        if "error" in result:
+            raise result["error"]
+        if "audio" not in result:
+            return " ".join(committed_text)
+
+        tail = result["audio"][committed:]
+        if len(tail) > rate // 10:
+            committed_text.extend(seg.text.strip() for seg in self._segments(tail, rate))
+        return " ".join(t for t in committed_text if t)
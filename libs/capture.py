@@ -0,0 +1,177 @@
+import threading
+import numpy as np
+import sounddevice as sd
+import keyboard
+
+
+class RingBuffer:
+    # Preallocated mono sample store. Positions are absolute sample counts,
+    # so a reader can ask for [start, end) without caring about wrap-around.
+    def __init__(self, capacity, dtype='int16'):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.total = 0
+
+    def reset(self):
+        self.total = 0
+
+    def write(self, samples):
+        n = len(samples)
+        if n >= self.capacity:
+            samples = samples[-self.capacity:]
+            self.total += n - self.capacity
+            n = self.capacity
+        pos = self.total % self.capacity
+        first = min(n, self.capacity - pos)
+        self.data[pos:pos + first] = samples[:first]
+        self.data[:n - first] = samples[first:]
+        self.total += n
+
+    def read(self, start, end):
+        start = max(start, self.total - self.capacity, 0)
+        end = min(end, self.total)
+        if end <= start:
+            return self.data[:0].copy()
+        a = start % self.capacity
+        b = a + (end - start)
+        if b <= self.capacity:
+            return self.data[a:b].copy()
+        return np.concatenate((self.data[a:], self.data[:b - self.capacity]))
+
+
+class Recorder:
+    """Records one utterance per call to record().
+
+    mode "vad" starts on speech and stops after silence_seconds of quiet,
+    mode "push_to_talk" starts when the hotkey is released and stops on the
+    next press. Both block on events instead of polling the keyboard.
+    on_utterance_start, if set, is called (from an audio or keyboard
+    thread) as soon as the utterance begins, and on_utterance_end (from
+    the recording thread) as soon as it has ended, before the audio is
+    handed back. abort() ends any recording in progress for good.
+    """
+    def __init__(self, sample_rate=22050, channels=1, dtype='int16', max_seconds=30,
+                 mode="vad", hotkey='space', vad_threshold=0.02, silence_seconds=0.8,
+                 min_speech_seconds=0.25, preroll_seconds=0.3, device=None):
+        self.sample_rate = sample_rate
+        self.device = device
+        self.channels = channels
+        self.dtype = dtype
+        self.max_seconds = max_seconds
+        self.mode = mode
+        self.hotkey = hotkey
+        self.vad_threshold = vad_threshold
+        self.silence_samples = int(silence_seconds * sample_rate)
+        self.min_speech_samples = int(min_speech_seconds * sample_rate)
+        self.preroll_samples = int(preroll_seconds * sample_rate)
+        self.scale = float(np.iinfo(dtype).max) if np.dtype(dtype).kind == 'i' else 1.0
+
+        capacity = int((max_seconds + preroll_seconds + 1) * sample_rate)
+        self.ring = RingBuffer(capacity, dtype)
+        self.speech_started = threading.Event()
+        self.speech_ended = threading.Event()
+        self.released = threading.Event()
+        self.pressed = threading.Event()
+        self.aborted = threading.Event()
+        self.on_utterance_start = None
+        self.on_utterance_end = None
+        self.last_seconds = 0.0
+        self._reset_vad()
+
+    def _reset_vad(self):
+        self.ring.reset()
+        self.speech_started.clear()
+        self.speech_ended.clear()
+        self.released.clear()
+        self.pressed.clear()
+        self.voiced_samples = 0
+        self.first_voice = None
+        self.last_voice = None
+        self.speech_start = None
+        self.utterance_start = None
+
+    def callback(self, indata, frames, time, status):
+        if status:
+            print(f"Status: {status}")
+        samples = indata[:, 0]
+        self.ring.write(samples)
+        if self.mode != "vad" or self.speech_ended.is_set():
+            return
+
+        level = np.sqrt(np.mean(np.square(samples, dtype=np.float32))) / self.scale
+        now = self.ring.total
+        if level >= self.vad_threshold:
+            if self.first_voice is None:
+                self.first_voice = now - frames
+            self.voiced_samples += frames
+            self.last_voice = now
+            if self.speech_start is None and self.voiced_samples >= self.min_speech_samples:
+                self.speech_start = max(self.first_voice - self.preroll_samples, 0)
+                self._begin_utterance(self.speech_start)
+                self.speech_started.set()
+        elif self.speech_start is None:
+            # A short blip followed by quiet is not speech yet
+            if self.first_voice is not None and now - self.last_voice > self.silence_samples:
+                self.first_voice = None
+                self.voiced_samples = 0
+        elif now - self.last_voice > self.silence_samples:
+            self.speech_ended.set()
+
+    def _begin_utterance(self, start):
+        self.utterance_start = start
+        if self.on_utterance_start is not None:
+            self.on_utterance_start()
+
+    def abort(self):
+        self.aborted.set()
+        for event in (self.speech_started, self.speech_ended, self.released, self.pressed):
+            event.set()
+
+    def _wait_for_speech(self, max_seconds):
+        print("Listening...")
+        self.speech_started.wait()
+        print("Recording...")
+        self.speech_ended.wait(timeout=max_seconds)
+        return self.speech_start, self.ring.total
+
+    def _wait_push_to_talk(self, max_seconds):
+        print(f"Press {self.hotkey} to start recording...")
+        hook = keyboard.on_release_key(self.hotkey, lambda e: self.released.set())
+        try:
+            self.released.wait()
+        finally:
+            keyboard.unhook(hook)
+
+        print("Recording...")
+        start = self.ring.total
+        self._begin_utterance(start)
+        hook = keyboard.on_press_key(self.hotkey, lambda e: self.pressed.set())
+        try:
+            self.pressed.wait(timeout=max_seconds)
+        finally:
+            keyboard.unhook(hook)
+        return start, self.ring.total
+
+    def live_audio(self, offset=0):
+        # Audio of the utterance in progress, from offset samples after its start
+        if self.utterance_start is None:
+            return None
+        return self.ring.read(self.utterance_start + offset, self.ring.total)
+
+    def record(self, max_seconds=None):
+        max_seconds = min(max_seconds or self.max_seconds, self.max_seconds)
+        if self.aborted.is_set():
+            return self.ring.data[:0].copy()
+        self._reset_vad()
+        with sd.InputStream(samplerate=self.sample_rate, channels=self.channels,
+                            dtype=self.dtype, device=self.device, callback=self.callback):
+            if self.mode == "push_to_talk":
+                start, end = self._wait_push_to_talk(max_seconds)
+            else:
+                start, end = self._wait_for_speech(max_seconds)
+            if self.on_utterance_end is not None and start is not None and not self.aborted.is_set():
+                self.on_utterance_end()
+        if self.aborted.is_set() or start is None:
+            return self.ring.data[:0].copy()
+        self.last_seconds = (end - start) / self.sample_rate
+        return self.ring.read(start, end)
@@ -0,0 +1,108 @@
+import threading
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English, plus the per-message overhead
+    return len(text) // 4 + 4
+
+
+class ConversationContext:
+    """Conversation history for _prompt, bounded by turns and by tokens.
+
+    messages() returns the newest user/assistant messages that fit in
+    window_turns turns and token_budget tokens. Anything older is dropped
+    for good, and if a summarise(summary, messages) callable is given it
+    is folded into a running summary that is sent ahead of the window.
+    summarise is a blocking LLM call, so it is not made by messages() but
+    by update_summary(), which the caller runs in the background once the
+    turn is over; the next prompt then picks up the new summary.
+
+    Once a limit is hit the window is cut back to trim_ratio of it in one
+    go rather than by one turn per prompt, so the history prefix stays the
+    same for several turns and provider prompt caching keeps hitting.
+    """
+    def __init__(self, token_budget=1500, window_turns=6, summarise=None, trim_ratio=0.5):
+        self.token_budget = token_budget
+        self.window_turns = window_turns
+        self.summarise = summarise
+        self.trim_ratio = trim_ratio
+        self.history = []
+        self.summary = ""
+        self.evicted = []  # dropped from the window, not yet summarised
+        self.summarising = False
+        self.lock = threading.Lock()
+        self.prompt_tokens = []
+        self.cached_tokens = []
+
+    def append(self, role, content):
+        self.history.append({"role": role, "content": content})
+
+    def _summary_message(self):
+        return {"role": "system", "content": "Summary of the conversation so far: " + self.summary}
+
+    def messages(self, reserved_tokens=0):
+        budget = self.token_budget - reserved_tokens
+        if self.summary:
+            budget -= estimate_tokens(self._summary_message()["content"])
+
+        keep = self._fits(self.window_turns * 2, budget)
+        if keep < len(self.history):
+            keep = self._fits(2 * int(self.window_turns * self.trim_ratio), int(budget * self.trim_ratio))
+
+        evicted = self.history[:len(self.history) - keep]
+        if evicted:
+            self.history = self.history[len(evicted):]
+            if self.summarise:
+                with self.lock:
+                    self.evicted.extend(evicted)
+
+        if self.summary:
+            return [self._summary_message()] + list(self.history)
+        return list(self.history)
+
+    def update_summary(self):
+        # Folds the evicted messages into the summary. If that fails the old
+        # summary stays and the same messages are tried again next time.
+        with self.lock:
+            if self.summarising or not self.evicted:
+                return
+            self.summarising = True
+            summary = self.summary
+            evicted = list(self.evicted)
+        try:
+            summary = self.summarise(summary, evicted)
+        except Exception as e:
+            print("Could not summarise history:", e)
+            return
+        finally:
+            with self.lock:
+                self.summarising = False
+        with self.lock:
+            self.summary = summary
+            del self.evicted[:len(evicted)]
+
+    def _fits(self, max_messages, budget):
+        keep = 0
+        used = 0
+        for message in reversed(self.history):
+            cost = estimate_tokens(message["content"])
+            if keep >= max_messages or used + cost > budget:
+                break
+            keep += 1
+            used += cost
+        # Cut in whole turns: a window never opens with a reply to a
+        # question that is no longer in it
+        if keep < len(self.history) and keep and self.history[-keep]["role"] == "assistant":
+            keep -= 1
+        return keep
+
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        self.prompt_tokens.append(usage.prompt_tokens)
+        self.cached_tokens.append(cached)
+        hit_rate = sum(self.cached_tokens) / max(sum(self.prompt_tokens), 1)
+        print(f"Prompt tokens this turn: {usage.prompt_tokens}, cached: {cached} "
+              f"(session cache hit rate {hit_rate:.0%}, history: {len(self.history)} messages)")
@@ -0,0 +1,178 @@
+import concurrent.futures
+import threading
+import time
+from collections import deque
+
+from libs.tracing import percentile
+
+# Shared network plumbing for the OpenAI and Daisys calls: one pooled,
+# keep-alive HTTP client, and per-stage deadlines with hedged requests.
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def request_errors():
+    # What a failed request can raise, for except clauses; a stream that
+    # breaks off may raise httpx's own errors. openai and httpx are only
+    # imported once an error is actually being handled.
+    import httpx
+    from openai import OpenAIError
+    return (DeadlineExceeded, OpenAIError, httpx.HTTPError)
+
+
+def pooled_openai(api_key, base_url=None, max_connections=20, keepalive_seconds=120, timeout=30.0):
+    """An OpenAI client on a shared connection pool.
+
+    Connections stay open between turns (httpx closes idle ones after 5 s
+    by default), and retries are left to hedged() so they count against
+    the stage deadline instead of adding to it.
+    """
+    import httpx
+    from openai import OpenAI
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=max_connections,
+                            keepalive_expiry=keepalive_seconds),
+        timeout=timeout
+    )
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+
+class Stage:
+    """Deadline and recent latencies of one kind of request.
+
+    The duplicate request is fired once an attempt has taken longer than
+    the p95 of the last window latencies (hedge_after until there are
+    enough of them, never earlier than min_hedge). With threads, attempts
+    run on a pool of that many threads of the stage's own rather than the
+    shared one, so a backlog at one service cannot hold up the others.
+    """
+    def __init__(self, name, deadline, hedge_after, min_hedge=0.2, hedges=1, window=50, threads=None):
+        self.name = name
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.min_hedge = min_hedge
+        self.hedges = hedges
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.expired = 0
+        self.executor = None
+        if threads:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads,
+                                                                  thread_name_prefix="hedged-" + name)
+
+    def hedge_delay(self):
+        with self.lock:
+            if len(self.latencies) < 10:
+                return self.hedge_after
+            return max(percentile(self.latencies, 95), self.min_hedge)
+
+    def record(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedged")
+
+
+def _discard(future, cleanup):
+    # Result of an attempt that lost the race (or came in after the deadline)
+    if cleanup is None or future.cancelled() or future.exception() is not None:
+        return
+    try:
+        cleanup(future.result())
+    except Exception:
+        pass
+
+
+def hedged(stage, call, cleanup=None):
+    """Run call(), blocking, within stage.deadline seconds.
+
+    If no attempt has succeeded after stage.hedge_delay(), or the only
+    attempt failed, the call is made again (up to stage.hedges extra
+    times) and whichever succeeds first wins. cleanup, if given, gets the
+    results of the attempts that lost. Raises DeadlineExceeded when the
+    deadline passes first, or the last error when every attempt failed.
+    """
+    start = time.perf_counter()
+    deadline = start + stage.deadline
+    hedge_at = start + stage.hedge_delay()
+    executor = stage.executor or _executor
+    pending = {executor.submit(call)}
+    launched = 1
+    error = None
+    with stage.lock:
+        stage.calls += 1
+
+    while pending:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        can_hedge = launched <= stage.hedges
+        wake = min(hedge_at, deadline) if can_hedge else deadline
+        done, pending = concurrent.futures.wait(pending, timeout=max(wake - now, 0),
+                                                return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                stage.record(time.perf_counter() - start)
+                for loser in pending:
+                    loser.add_done_callback(lambda f: _discard(f, cleanup))
+                return future.result()
+            error = future.exception()
+
+        if can_hedge and (not pending or time.perf_counter() >= hedge_at):
+            pending.add(executor.submit(call))
+            launched += 1
+            with stage.lock:
+                stage.hedged += 1
+
+    for late in pending:
+        late.add_done_callback(lambda f: _discard(f, cleanup))
+    if pending or error is None:
+        stage.record(stage.deadline)
+        with stage.lock:
+            stage.expired += 1
+        raise DeadlineExceeded(f"{stage.name} took longer than {stage.deadline}s")
+    raise error
+
+
+# A whole chat completion and the first token of a streamed one take very
+# different times, so each has a stage (and a p95) of its own
+LLM_FULL_STAGE = Stage("llm_full", deadline=8.0, hedge_after=2.5)
+LLM_FIRST_TOKEN_STAGE = Stage("llm_first_token", deadline=8.0, hedge_after=1.5)
+
+
+def complete(client, stage, messages, model="gpt-4o-mini", **options):
+    # A chat completion within stage.deadline, sent twice if it is slow
+    client = client.with_options(timeout=stage.deadline)
+    return hedged(stage, lambda: client.chat.completions.create(model=model, messages=messages, **options))
+
+
+def _chunks(first, stream):
+    try:
+        if first is not None:
+            yield first
+        yield from stream
+    finally:
+        stream.close()
+
+
+def complete_stream(client, stage, messages, model="gpt-4o-mini", **options):
+    """A streamed chat completion, as an iterator over its chunks.
+
+    An attempt counts as done at its first chunk, so the deadline and the
+    hedge cover the time to first token; losing attempts are closed.
+    Closing the iterator closes the stream.
+    """
+    client = client.with_options(timeout=stage.deadline)
+
+    def attempt():
+        stream = client.chat.completions.create(model=model, messages=messages, stream=True, **options)
+        return stream, next(stream, None)
+
+    stream, first = hedged(stage, attempt, cleanup=lambda result: result[0].close())
+    return _chunks(first, stream)
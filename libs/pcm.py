@@ -0,0 +1,24 @@
+import io
+import wave
+import numpy as np
+
+
+def wav_to_stereo_pcm(wav_bytes):
+    """Turn an in-memory 16-bit WAV into interleaved stereo PCM for the robot.
+
+    Returns (memoryview, rate). The WAV frames are viewed in place and the
+    mono-to-stereo interleave is the only copy made.
+    """
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError("Expected 16-bit audio, got %d-byte samples" % wav.getsampwidth())
+        rate = wav.getframerate()
+        channels = wav.getnchannels()
+        frames = wav.readframes(wav.getnframes())
+
+    samples = np.frombuffer(frames, dtype='<i2')
+    if channels == 1:
+        samples = np.repeat(samples, 2)
+    elif channels != 2:
+        raise ValueError("Expected mono or stereo audio, got %d channels" % channels)
+    return memoryview(samples).cast('B'), rate
@@ -0,0 +1,49 @@
+from twisted.internet.defer import DeferredQueue, DeferredSemaphore, inlineCallbacks
+
+
+class RobotAudioStream:
+    """Plays PCM on the robot in fixed-size chunks as it becomes available.
+
+    feed() returns a Deferred that fires once the audio has been queued.
+    At most max_chunks chunks wait at a time, so a producer that waits on
+    feed() never runs more than that far ahead of the robot and memory
+    stays bounded however long the reply is. chunk_seconds=None sends each
+    fed buffer as one chunk, like a single audio.play call.
+    """
+    def __init__(self, session, chunk_seconds=1.0, max_chunks=3, channels=2):
+        self.session = session
+        self.chunk_seconds = chunk_seconds
+        self.channels = channels
+        self.chunks = DeferredQueue()
+        self.slots = DeferredSemaphore(max_chunks)
+        self.done = self._play()
+
+    @inlineCallbacks
+    def feed(self, pcm, rate):
+        pcm = memoryview(pcm).cast('B')
+        if self.chunk_seconds is None:
+            size = len(pcm) or 1
+        else:
+            size = int(rate * self.chunk_seconds) * 2 * self.channels
+        for start in range(0, len(pcm), size):
+            yield self.slots.acquire()
+            self.chunks.put((pcm[start:start + size], rate))
+
+    def close(self):
+        # Fires once everything fed so far has been played
+        self.chunks.put(None)
+        return self.done
+
+    @inlineCallbacks
+    def _play(self):
+        while True:
+            item = yield self.chunks.get()
+            if item is None:
+                break
+            data, rate = item
+            try:
+                yield self.session.call("rom.actuator.audio.play", data=data, rate=rate, sync=True)
+            except Exception as e:
+                print("Error playing audio chunk:", e)
+            finally:
+                self.slots.release()
@@ -0,0 +1,32 @@
+import re
+
+# Sentence end: . ! or ? (optionally closed by a quote or bracket) followed by whitespace
+_BOUNDARY = re.compile(r'[.!?]+["\')\]]*\s+')
+
+
+class SentenceSplitter:
+    """Cuts a stream of text deltas into whole sentences as they complete.
+
+    Pieces shorter than min_chars are held back and joined to the next one,
+    so "Hi." or "Mr." is not sent to speech synthesis on its own.
+    """
+    def __init__(self, min_chars=12):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, delta):
+        self.buffer += delta
+        sentences = []
+        start = 0
+        for match in _BOUNDARY.finditer(self.buffer):
+            if match.end() - start < self.min_chars:
+                continue
+            sentences.append(self.buffer[start:match.end()].strip())
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
@@ -0,0 +1,34 @@
+from twisted.internet.defer import Deferred, succeed
+
+
+class Speculation:
+    """Something prepared in the background before it is known to be needed.
+
+    prepare() returns a Deferred and is started right away. fingerprint is
+    whatever the result depends on: take(fingerprint) hands the result over
+    (waiting for it if it is still being prepared) only when the fingerprint
+    is unchanged, and otherwise throws it away and gives None, as it does
+    when preparing failed. A speculation can be taken once.
+    """
+    def __init__(self, fingerprint, prepare):
+        self.fingerprint = fingerprint
+        self.result = None
+        self.taken = False
+        self.done = prepare()
+        self.done.addCallbacks(self._store, self._failed)
+
+    def _store(self, result):
+        self.result = result
+
+    def _failed(self, failure):
+        print("Speculative preparation failed:", failure.getErrorMessage())
+
+    def take(self, fingerprint):
+        if self.taken or fingerprint != self.fingerprint:
+            self.taken = True
+            self.result = None
+            return succeed(None)
+        self.taken = True
+        taken = Deferred()
+        self.done.addBoth(lambda _: taken.callback(self.result))
+        return taken
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+
+
+def percentile(values, p):
+    # Nearest-rank percentile, good enough for a few dozen turns
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(p / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class TurnTrace:
+    """Stage timings and counters for one turn.
+
+    mark(stage) stores seconds since the turn started on the monotonic
+    clock, and only the first mark of a stage counts, so "first audio"
+    style stages can be marked from every sentence. add() sums counters
+    such as token counts and audio durations.
+    """
+    def __init__(self, phase, turn):
+        self.start = time.perf_counter()
+        self.phase = phase
+        self.turn = turn
+        self.marks = {}
+        self.counts = {}
+
+    def mark(self, stage):
+        if stage not in self.marks:
+            self.marks[stage] = round(time.perf_counter() - self.start, 4)
+
+    def add(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def response_latency(self):
+        # From the end of the participant's speech (not of its transcription)
+        # to the robot starting to talk
+        if "capture_end" in self.marks and "output_start" in self.marks:
+            return self.marks["output_start"] - self.marks["capture_end"]
+        return None
+
+
+class Tracer:
+    # Writes one JSON line per turn and a summary line when the session ends
+    def __init__(self, directory="traces", name="session"):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, name + time.strftime("-%Y%m%d-%H%M%S.jsonl"))
+        self.turns = 0
+        self.latencies = []
+
+    def turn(self, phase):
+        self.turns += 1
+        return TurnTrace(phase, self.turns)
+
+    def _write(self, record):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def finish(self, trace):
+        latency = trace.response_latency()
+        if latency is not None:
+            self.latencies.append(latency)
+        self._write({
+            "turn": trace.turn,
+            "phase": trace.phase,
+            "stages": trace.marks,
+            "counts": trace.counts,
+            "response_latency": latency,
+        })
+
+    def summary(self):
+        summary = {
+            "summary": True,
+            "turns": self.turns,
+            "response_latency_p50": percentile(self.latencies, 50),
+            "response_latency_p95": percentile(self.latencies, 95),
+        }
+        self._write(summary)
+        print(f"Response latency over {len(self.latencies)} turns: "
+              f"p50 {summary['response_latency_p50']}s, p95 {summary['response_latency_p95']}s ({self.path})")
+        return summary
+
+
+class StartupProfile:
+    """Start-up phases as (start, end) offsets in seconds from origin.
+
+    Phases that run concurrently overlap, so report() lists them in order
+    of starting and gives the overall time until the last one ended.
+    """
+    def __init__(self, origin=None):
+        self.origin = time.perf_counter() if origin is None else origin
+        self.spans = {}
+        self.lock = threading.Lock()
+
+    def _now(self):
+        return time.perf_counter() - self.origin
+
+    def begin(self, name, at=None):
+        with self.lock:
+            self.spans[name] = [self._now() if at is None else at, None]
+
+    def end(self, name):
+        with self.lock:
+            span = self.spans.setdefault(name, [0.0, None])
+            if span[1] is None:
+                span[1] = self._now()
+
+    def report(self):
+        print(f"\n{'start-up phase':32} {'start':>8} {'end':>8} {'took':>8}")
+        ended = []
+        for name, (start, end) in sorted(self.spans.items(), key=lambda item: item[1][0]):
+            if end is None:
+                print(f"{name:32} {start:8.3f} {'-':>8} {'-':>8}")
+                continue
+            ended.append(end)
+            print(f"{name:32} {start:8.3f} {end:8.3f} {end - start:8.3f}")
+        if ended:
+            print(f"{'total':32} {0:8.3f} {max(ended):8.3f} {max(ended):8.3f}")
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def normalise_text(text):
+    return " ".join(text.split())
+
+
+class TTSCache:
+    """Synthesised speech on disk, keyed by voice, prosody and text.
+
+    Entries hold PCM exactly as it is played (with the sample rate in a
+    4-byte header), so a hit skips synthesis and conversion. The directory
+    is kept under max_bytes by evicting the least recently used entries.
+    """
+    def __init__(self, directory="tts_cache", max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+        found = []
+        for name in os.listdir(directory):
+            if name.endswith(".pcm"):
+                st = os.stat(os.path.join(directory, name))
+                found.append((st.st_mtime, name[:-4], st.st_size))
+        for mtime, key, size in sorted(found):
+            self.entries[key] = size
+            self.size += size
+
+    @staticmethod
+    def key(voice_id, prosody, text):
+        blob = json.dumps([voice_id, prosody, normalise_text(text)])
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pcm")
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+        except OSError:
+            with self.lock:
+                self.size -= self.entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        (rate,) = struct.unpack("<I", data[:4])
+        return data[4:], rate
+
+    def put(self, key, pcm, rate):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(struct.pack("<I", rate))
+            f.write(pcm)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, self._path(key))
+
+        with self.lock:
+            self.size += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.size -= old_size
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def get_or_create(self, voice_id, prosody, text, synthesise):
+        # synthesise(text) -> (pcm, rate), only called on a miss
+        key = self.key(voice_id, prosody, text)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        pcm, rate = synthesise(text)
+        self.put(key, pcm, rate)
+        return pcm, rate
+
+    def prewarm(self, voice_id, prosody, texts, synthesise):
+        for text in texts:
+            try:
+                self.get_or_create(voice_id, prosody, text, synthesise)
+            except Exception as e:
+                print("Could not pre-warm speech for:", text, e)
@@ -1,42 +1,92 @@
+import time
+_STARTED = time.perf_counter()  # origin of the --profile-startup report
+
 from autobahn.twisted.component import Component, run
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, Deferred, DeferredList, DeferredQueue, DeferredSemaphore, succeed
 from twisted.internet.threads import deferToThread
-from twisted.internet.task import deferLater
+import argparse
+import concurrent.futures
 import os
-import numpy as np
-import sounddevice as sd
-import soundfile as sf
-import keyboard
-import time
-import wave
 import subprocess
+import threading
 import sys
 
-from openai import OpenAI
+# openai, daisys, keyboard and sounddevice (libs.capture) are imported by the
+# code that uses them, so none of them hold up the start of the WAMP connect
 from libs.starttypes import text, number
-from sudoku_context import generate_hint_from_file
-from faster_whisper import WhisperModel
-from pydub import AudioSegment
-from pydub.playback import play
-from scipy.io.wavfile import write, read
-
-from daisys import DaisysAPI
-from daisys.v1.speak import SimpleProsody
-from daisys.v1 import speak as lee
+from libs.sentences import SentenceSplitter
+from libs.context import ConversationContext, estimate_tokens
+from libs.pcm import wav_to_stereo_pcm
+from libs.playback import RobotAudioStream
+from libs.tts_cache import TTSCache
+from libs.tracing import StartupProfile, Tracer
+from libs.speculation import Speculation
+from libs.net import (DeadlineExceeded, LLM_FIRST_TOKEN_STAGE, LLM_FULL_STAGE, Stage, complete, complete_stream,
+                      hedged, pooled_openai, request_errors)
+from libs.asr import WHISPER_SAMPLE_RATE, ASRPool, StreamingTranscriber, to_whisper_input
+from sudoku_context import HintCache, generate_hint, generate_hint_from_file
+from board_sync import BoardMirror
+from sudoku_generator import DIFFICULTIES
+
+STARTUP = StartupProfile(_STARTED)
+STARTUP.begin("imports", at=0.0)
+STARTUP.end("imports")
 
 # Set-up
 LLMClient = False
-sample_rate = 22050
+sample_rate = WHISPER_SAMPLE_RATE  # capture at Whisper's native rate, no resampling
 channels = 1
-dtype = 'int16'
-audio_buffer = []
-conversation_history = []
-USE_DAISYS = None
+dtype = 'float32'
+LISTEN_MODE = "push_to_talk"  # or "vad" to stop recording on silence
+STREAMING_ASR = True  # transcribe while the participant is still speaking
+STREAM_REPLIES = True  # speak the reply sentence by sentence as it is generated
+# Size of each audio.play call, None sends each take (or sentence) in one go.
+# Every call is sync=True, so chunking adds a round trip and an audible gap per
+# chunk; only set this once chunked playback has been measured on the robot.
+PLAYBACK_CHUNK_SECONDS = None
+HISTORY_TOKEN_BUDGET = 1500  # tokens of history sent along with each prompt
+HISTORY_WINDOW_TURNS = 6
+SUMMARISE_HISTORY = True
 DAISYS_VOICE = None
 DAISYS_CLIENT = None
-WHISPER_MODEL = WhisperModel("base", device="cpu", compute_type="int8")
-current_phase = 0
+WHISPER_SETTINGS = {
+    "model_size": "base",
+    "device": "cpu",
+    "compute_type": "int8",
+    "cpu_threads": 0,  # 0 lets CTranslate2 decide
+    "num_workers": 1,
+    "beam_size": 5,
+}
+ASR_WORKERS = 2  # Whisper processes shared by all booths
+WHISPER_MODEL = ASRPool(ASR_WORKERS, **WHISPER_SETTINGS)  # loads lazily in processes of its own
+PHASE_1_START = 30  # seconds after the robot stands up
+PHASE_2_START = 300
+SPECULATE_LEAD = 20  # seconds before the conclusion to have its reply and audio ready
+DAISYS_PROSODY = {"pace": 0, "pitch": 0, "expression": 5}
+PUZZLE_BANK = "puzzles.bank"  # written by sudoku_generator.py, puzzle2.txt is used without it
+TTS_CACHE_DIR = "tts_cache"
+TTS_CACHE_MAX_BYTES = 200 * 1024 * 1024
+TTS_CACHE = None
+WAMP_URL = "ws://wamp.robotsindeklas.nl"
+# Deadlines for the network calls. A call slower than the stage's p95 is
+# sent a second time; past the deadline the robot falls back to a canned
+# reply (LLM, see libs.net for its stages) or to its own voice (Daisys).
+TTS_STAGE = Stage("tts", deadline=6.0, hedge_after=3.0, threads=16)  # Daisys cannot starve the LLM calls
+SUMMARY_STAGE = Stage("summary", deadline=10.0, hedge_after=4.0)  # in the background, between turns
+FALLBACK_REPLY = "Sorry, I lost my train of thought for a moment. Could you say that again?"
+FALLBACK_CONCLUSION = "We have run out of time, so this is where we stop. Thank you for taking part, goodbye!"
+
+# One entry per robot served by this process. Each booth needs its own
+# microphone (a sounddevice input device) and its own keys.
+BOOTHS = [
+    {"name": "booth1", "realm": "rie.685cdb0798c949e6910eac04", "input_device": None,
+     "talk_key": "space", "quit_key": "q"},
+]
+SESSIONS = []
+READY = {}  # start-up work running in the background, as Futures by name
+PROFILE_STARTUP = False
+PROFILED = []  # booths that are ready, with --profile-startup
 
 # Task Prompts
 SYSTEM_PROMPT_A = (
@@ -78,21 +128,38 @@ PHASE_PROMPT_2 = (
                     "Conclude your interaction, say goodbye and thank the participant for their time."
                     "YOU MUST IMMEDIATELY END THE CONVERSATION."
                 )
+# Said as soon as the researcher has finished the introduction, while the
+# reply to what they said is still being generated. Its audio is prepared
+# before anyone speaks.
+OPENING_GREETING = "Hello, nice to meet you! My name is Charlie, and I am a robot."
+# Everything the robot says word for word, synthesised once Daisys is logged in
+FIXED_LINES = [OPENING_GREETING, FALLBACK_REPLY, FALLBACK_CONCLUSION]
+
 ## Actual Code
 def _getOpenAiClient():
+    # One client (and so one connection pool) for every session
     if "OPENAI_API_KEY" not in os.environ:
         raise RuntimeError("Set OPENAI_API_KEY in your environment.")
     global LLMClient
     if not LLMClient:
-        LLMClient = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+        LLMClient = pooled_openai(os.environ["OPENAI_API_KEY"])
     return LLMClient
 
+def _complete(messages):
+    return complete(_getOpenAiClient(), LLM_FULL_STAGE, messages)
+
+def _complete_stream(messages):
+    return complete_stream(_getOpenAiClient(), LLM_FIRST_TOKEN_STAGE, messages,
+                           stream_options={"include_usage": True})
+
 def init_daisys():
     global DAISYS_CLIENT, DAISYS_VOICE
 
     email = os.environ["DAISYS_EMAIL"]
     password = os.environ["DAISYS_PASSWORD"]
 
+    from daisys import DaisysAPI
+
     # Get just the 'speak' subclient
     speak = DaisysAPI("speak", email=email, password=password).get_client()
 
@@ -104,222 +171,714 @@ def init_daisys():
     DAISYS_VOICE = voices[0]
     print(f"Using Daisys voice: {DAISYS_VOICE.name}")
 
-def callback(indata, frames, time, status):
-    if status:
-        print(f"Status: {status}")
-    audio_buffer.append(indata.copy())
-
-def toStereo(data):
-    c = np.empty((2*data.size,), dtype=data.dtype)
-    c[0::2] = data
-    c[1::2] = data
-    return c
-
-def sleep(seconds):
-    return deferLater(reactor, seconds, lambda: None)
-
-def _listen(lenArg):
-    global audio_buffer
-    audio_buffer = []
-    max_rec_time = lenArg.value
-
-    print("Press space to start recording...")
-    while not keyboard.is_pressed('space'):
-        pass
-    while keyboard.is_pressed('space'):
-        pass
-    print("Recording...")
-
-    with sd.InputStream(samplerate=sample_rate, channels=channels, dtype=dtype, callback=callback):
-        start_time = time.time()
-        while time.time() - start_time < max_rec_time and not keyboard.is_pressed('space'):
-            pass
-
-    audio_data = np.concatenate(audio_buffer, axis=0)
-    sf.write("temp.wav", audio_data, sample_rate, format="wav")
-
-    segments, info = WHISPER_MODEL.transcribe("temp.wav")
-
-    transcript = ""
-    for segment in segments:
-        transcript += segment.text.strip() + " "
-
-    return text(transcript.strip())
-
-
-def _prompt(s1, hint):
-    global current_phase, conversation_history
-
-    client = _getOpenAiClient()
-    system_prompt = SYSTEM_PROMPT_A if PROMPT == "A" else SYSTEM_PROMPT_B
-    if current_phase == 0:
-        phase_prompt = PHASE_PROMPT_0
-    elif current_phase == 1:
-        if PROMPT == "A":
-            phase_prompt = PHASE_PROMPT_1_A
-        else:
-            phase_prompt = PHASE_PROMPT_1_B
-    else:
-        phase_prompt = PHASE_PROMPT_2
-
-    combined_prompt = f"{system_prompt}\n{phase_prompt}\n{hint}"
-
-    print(combined_prompt)
-
-    if current_phase == 2:
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    system_prompt + "\n\n"
-                    "!!! IMPORTANT: This is the final phase. You must CONCLUDE the session now. "
-                    "Thank the participant and say goodbye. Do NOT continue the conversation.\n\n"
-                    + phase_prompt + "\n" + str(hint)
-                )
-            },
-            {"role": "user", "content": "Please conclude the session now."}
-            ]
-    else:
-        # Phases 0 and 1 — maintain and grow conversation history
-        messages = [{"role": "system", "content": combined_prompt}]
-        messages.extend(conversation_history)  # only user/assistant pairs
-        messages.append({"role": "user", "content": s1.value})
-
-    print(messages)
-
-    conversation_history.append({"role": "user", "content": s1.value})
-
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages
-    )
-
-    reply = completion.choices[0].message.content
-    if current_phase != 2:
-        conversation_history.append({"role": "assistant", "content": reply})
-
-    return text(value=reply)
-
-def speak_with_daisys(text_to_speak):
-    global DAISYS_CLIENT, DAISYS_VOICE
-
+def _summarise(summary, messages):
+    # Fold turns that fell out of the history window into a short running summary
+    transcript = "\n".join(m["role"] + ": " + m["content"] for m in messages)
+    completion = complete(_getOpenAiClient(), SUMMARY_STAGE, [
+        {"role": "system", "content": "Update the summary of a conversation between a robot and a participant. "
+                                      "Keep names, facts and what was agreed. At most 80 words."},
+        {"role": "user", "content": "Summary so far: " + (summary or "none") + "\n\nNew turns:\n" + transcript}
+    ], max_tokens=150)
+    return completion.choices[0].message.content
+
+def _speech_units(reply):
+    # How a reply is cut up for synthesis, which is also how its audio is cached
+    if not STREAM_REPLIES:
+        return [reply]
+    splitter = SentenceSplitter()
+    return splitter.feed(reply) + splitter.flush()
+
+def _synthesise_hedged(text_to_speak):
+    # generate_take polls until the take is ready, this bounds the whole pair
+    return hedged(TTS_STAGE, lambda: _synthesise_daisys(text_to_speak))
+
+def _synthesise_cached(text_to_speak):
+    if TTS_CACHE is None:
+        return _synthesise_hedged(text_to_speak)
+    return TTS_CACHE.get_or_create(DAISYS_VOICE.voice_id, DAISYS_PROSODY, text_to_speak, _synthesise_hedged)
+
+def prewarm_daisys():
+    # Synthesise the fixed lines up front, cut up the way they will be spoken
+    texts = [unit for line in FIXED_LINES for unit in _speech_units(line)]
+    TTS_CACHE.prewarm(DAISYS_VOICE.voice_id, DAISYS_PROSODY, texts, _synthesise_daisys)
+    print(f"Pre-warmed {len(texts)} cached utterances.")
+
+def _synthesise_daisys(text_to_speak):
+    from daisys.v1.speak import SimpleProsody
+
+    # Polling stops at the deadline, so an attempt hedged() has given up on
+    # does not keep a thread busy
     take = DAISYS_CLIENT.generate_take(
         voice_id=DAISYS_VOICE.voice_id,
         text=text_to_speak,
-        prosody=SimpleProsody(pace=0, pitch=0, expression=5)
+        prosody=SimpleProsody(**DAISYS_PROSODY),
+        timeout=TTS_STAGE.deadline
     )
+    if not take.status.ready():
+        raise DeadlineExceeded(f"Daisys take {take.take_id} not ready after {TTS_STAGE.deadline}s")
 
-    DAISYS_CLIENT.get_take_audio(take_id=take.take_id, file="daisys_reply.wav", format="wav")
+    # Keep the take in memory, no daisys_reply.wav round-trip
+    wav_bytes = DAISYS_CLIENT.get_take_audio(take_id=take.take_id, format="wav")
     print("saying hello!")
 
-    [rate,data]=read("daisys_reply.wav")
-    raw=toStereo((data).astype(np.int16)).tobytes()
-
+    raw, rate = wav_to_stereo_pcm(wav_bytes)
     return raw, rate
 
+def _warm_up_llm():
+    # Opens the HTTPS connection to OpenAI so the real request does not pay for it
+    try:
+        _getOpenAiClient().models.retrieve("gpt-4o-mini")
+    except Exception as e:
+        print("LLM warm-up failed:", e)
+
+
+class Session:
+    """Everything that belongs to one robot and its participant.
+
+    The Whisper pool, the OpenAI and Daisys clients and the TTS cache are
+    module-level and shared; conversation history, phase, microphone,
+    Sudoku window and traces are per session, so one process can run
+    several booths side by side.
+    """
+    def __init__(self, name, realm, task="A", use_daisys=False, input_device=None,
+                 talk_key="space", quit_key="q", difficulty=None):
+        self.name = name
+        self.difficulty = difficulty
+        self.realm = realm
+        self.task = task
+        self.use_daisys = use_daisys
+        self.input_device = input_device
+        self.talk_key = talk_key
+        self.quit_key = quit_key
+        self.current_phase = 0
+        self.recorder = None
+        self.tracer = None
+        self.trace = None  # timings of the turn in progress
+        self.sudoku_process = None
+        self.board = None
+        self.snapshot_path = "sudoku_board.txt" if len(BOOTHS) == 1 else f"sudoku_board_{name}.txt"
+        self.hint_cache = HintCache()
+        self.speculations = {}  # phase -> Speculation of the reply that opens it
+        self.listening = False  # waiting for the participant to start speaking
+        self.history = ConversationContext(
+            token_budget=HISTORY_TOKEN_BUDGET,
+            window_turns=HISTORY_WINDOW_TURNS,
+            summarise=_summarise if SUMMARISE_HISTORY else None
+        )
+
+    def component(self):
+        wamp = Component(
+            transports=[{
+                "url": WAMP_URL,
+                "serializers": ["msgpack"],
+                "max_retries": 0
+            }],
+            realm=self.realm,
+        )
+        wamp.on_join(self.main)
+        return wamp
+
+    def start_sudoku(self):
+        print(f"\nLaunching Sudoku interface for {self.name}...")
+        command = [sys.executable, "sudoku.py", "--push", "--snapshot", self.snapshot_path]
+        if self.difficulty is not None:
+            if os.path.exists(PUZZLE_BANK):
+                command += ["--bank", PUZZLE_BANK, "--difficulty", self.difficulty]
+            else:
+                print(f"No {PUZZLE_BANK} yet (see sudoku_generator.py), using the default puzzle")
+        self.sudoku_process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+        self.board = BoardMirror(self.sudoku_process.stdout).start()
+
+    def _getRecorder(self):
+        if self.recorder is None:
+            from libs.capture import Recorder
+            self.recorder = Recorder(sample_rate=sample_rate, channels=channels, dtype=dtype,
+                                     mode=LISTEN_MODE, hotkey=self.talk_key, device=self.input_device)
+        return self.recorder
+
+    def _mark(self, stage):
+        if self.trace is not None:
+            self.trace.mark(stage)
+
+    def _count(self, name, value):
+        if self.trace is not None:
+            self.trace.add(name, value)
+
+    def _count_usage(self, usage):
+        self.history.record_usage(usage)
+        if usage is not None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            self._count("prompt_tokens", usage.prompt_tokens)
+            self._count("completion_tokens", usage.completion_tokens)
+            self._count("cached_tokens", getattr(details, "cached_tokens", None) or 0)
+
+    def _listen(self, lenArg):
+        if STREAMING_ASR:
+            transcriber = StreamingTranscriber(WHISPER_MODEL, on_partial=lambda partial: print(f"[{self.name}] Partial:", partial))
+            return text(transcriber.transcribe(self._getRecorder(), lenArg.value))
+
+        audio_data = self._getRecorder().record(lenArg.value)
+        segments, info = WHISPER_MODEL.transcribe(to_whisper_input(audio_data, sample_rate))
+
+        transcript = ""
+        for segment in segments:
+            transcript += segment.text.strip() + " "
+
+        return text(transcript.strip())
+
+    def _build_messages(self, s1, hint, phase=None):
+        phase = self.current_phase if phase is None else phase
+        system_prompt = SYSTEM_PROMPT_A if self.task == "A" else SYSTEM_PROMPT_B
+        if phase == 0:
+            phase_prompt = PHASE_PROMPT_0
+        elif phase == 1:
+            if self.task == "A":
+                phase_prompt = PHASE_PROMPT_1_A
+            else:
+                phase_prompt = PHASE_PROMPT_1_B
+        else:
+            phase_prompt = PHASE_PROMPT_2
+
+        # Static parts first so the prefix stays byte-identical within a phase and
+        # the provider's prompt cache can hit; the board and hint change every turn
+        # and go last, right before the user's words.
+        static_prompt = f"{system_prompt}\n{phase_prompt}"
+        volatile = [{"role": "system", "content": str(hint)}] if str(hint).strip() else []
+
+        print(static_prompt)
+
+        if phase == 2:
+            messages = [
+                {
+                    "role": "system",
+                    "content": (
+                        system_prompt + "\n\n"
+                        "!!! IMPORTANT: This is the final phase. You must CONCLUDE the session now. "
+                        "Thank the participant and say goodbye. Do NOT continue the conversation.\n\n"
+                        + phase_prompt
+                    )
+                },
+                {"role": "user", "content": "Please conclude the session now."}
+                ]
+        else:
+            # Phases 0 and 1 — maintain and grow conversation history
+            messages = [{"role": "system", "content": static_prompt}]
+            reserved = estimate_tokens(static_prompt) + estimate_tokens(str(hint))
+            messages.extend(self.history.messages(reserved_tokens=reserved))
+            messages.extend(volatile)
+            messages.append({"role": "user", "content": s1.value})
+
+        print(messages)
+        return messages
+
+    def _fallback_reply(self, error):
+        # Neither the reply nor the question goes into the history
+        print(f"[{self.name}] No reply from the LLM in time ({error}), using a canned one")
+        self._count("llm_fallback", 1)
+        return FALLBACK_REPLY
+
+    def _prompt(self, s1, hint, phase):
+        messages = self._build_messages(s1, hint, phase=phase)
+
+        self._mark("llm_request")
+        try:
+            completion = _complete(messages)
+        except request_errors() as e:
+            return text(value=self._fallback_reply(e))
 
+        self._count_usage(completion.usage)
+        reply = completion.choices[0].message.content
+        self._mark("llm_done")
 
-@inlineCallbacks
-def main(session, details):
-    global current_phase
-    yield session.call("rom.actuator.audio.volume", volume=45)
+        self.history.append("user", s1.value)
+        if phase != 2:
+            self.history.append("assistant", reply)
 
-    
-    print("Press 'q' at any time to quit.")
-    yield session.call("rom.optional.behavior.play", name="BlocklyStand")
+        return text(value=reply)
 
-    start_time = time.time()
+    def _prompt_stream(self, s1, hint, on_sentence, phase):
+        # Same as _prompt, but hands each sentence to on_sentence as soon as it is complete
+        messages = self._build_messages(s1, hint, phase=phase)
 
-    while not keyboard.is_pressed('q'):
-        yield sleep(0.1)
+        self._mark("llm_request")
         try:
-            # Phases activation
-            current_time = time.time()
-            if 300 > (current_time - start_time) > 30:
-                current_phase = 1
-                print("Currently in the task phase, " + str((current_time - start_time)))
-            elif (current_time - start_time) > 300:
-                current_phase = 2
-                print("Currently in the  conclusion phase, " + str((current_time - start_time)))
-            else:
-                print("Currently in the introduction phase, " + str((current_time - start_time)))
-            
-            # Listening
-            user_input = yield deferToThread(_listen, number(30))
-            print("User said:", user_input.value)
-
-            if PROMPT == "A":
-                hint = yield deferToThread(generate_hint_from_file, "sudoku_board.txt")
+            stream = _complete_stream(messages)
+        except request_errors() as e:
+            reply = self._fallback_reply(e)
+            for sentence in _speech_units(reply):
+                on_sentence(sentence)
+            return text(value=reply)
+
+        splitter = SentenceSplitter()
+        reply = ""
+        try:
+            for chunk in stream:
+                if chunk.usage:
+                    self._count_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                self._mark("llm_first_token")
+                delta = chunk.choices[0].delta.content or ""
+                reply += delta
+                for sentence in splitter.feed(delta):
+                    self._mark("first_sentence")
+                    on_sentence(sentence)
+        except request_errors() as e:
+            if not reply.strip():
+                splitter.flush()
+                reply = self._fallback_reply(e)
+                for sentence in _speech_units(reply):
+                    on_sentence(sentence)
+                return text(value=reply)
+            # What was said stands: the rest of it is spoken and it goes into
+            # the history as the reply the participant actually heard
+            print(f"[{self.name}] Reply from the LLM cut off ({e}), keeping what arrived")
+            self._count("llm_cut_off", 1)
+        for sentence in splitter.flush():
+            self._mark("first_sentence")
+            on_sentence(sentence)
+        self._mark("llm_done")
+
+        self.history.append("user", s1.value)
+        if phase != 2:
+            self.history.append("assistant", reply)
+
+        return text(value=reply)
+
+    def speak_with_daisys(self, text_to_speak):
+        # None if Daisys did not make its deadline, the robot's own voice is used then
+        try:
+            raw, rate = _synthesise_cached(text_to_speak)
+        except Exception as e:
+            print(f"[{self.name}] No speech from Daisys in time ({e}), using the NAO voice")
+            self._count("tts_fallback", 1)
+            return None
+        self._mark("tts_first_audio")
+        self._count("tts_audio_seconds", len(raw) / 4 / rate)
+        return raw, rate
+
+    @inlineCallbacks
+    def _reply_streamed(self, session, response, hint, phase, lead=None):
+        # Synthesis of sentence n+1 runs while sentence n is being played.
+        # lead, a prepared (reply, audio), is played first while the LLM works.
+        pending = DeferredQueue()
+        synthesis = DeferredSemaphore(2)
+        audio = RobotAudioStream(session, chunk_seconds=PLAYBACK_CHUNK_SECONDS) if self.use_daisys else None
+
+        def on_sentence(sentence):
+            if self.use_daisys:
+                pending.put((sentence, synthesis.run(deferToThread, self.speak_with_daisys, sentence)))
             else:
-                hint = " "
-
-            response = text("\nUser said: " + user_input.value)
-            
-
-            # Thinking
-            reply = yield deferToThread(_prompt, response, hint)
-            print("GPT-4o mini reply:", reply.value)
-
-            yield sleep(0.1)
-
-            # Talking
-            # Use Daisys API for TTS instead of NAO
-            if USE_DAISYS:
-                print("Speaking using DAISYS")
-                raw, rate = yield deferToThread(speak_with_daisys, reply.value)
-                yield session.call("rom.actuator.audio.play", data=raw, rate=rate, sync=True)
+                pending.put((sentence, succeed(None)))
+
+        done = deferToThread(self._prompt_stream, response, hint, lambda s: reactor.callFromThread(on_sentence, s), phase)
+        done.addBoth(lambda result: (pending.put(None), result)[1])
+
+        if lead is not None:
+            self._mark("output_start")
+            yield self._play_prepared(session, *lead)
+
+        while True:
+            item = yield pending.get()
+            if item is None:
+                break
+            sentence, synthesised = item
+            speech = yield synthesised
+            self._mark("output_start")
+            if speech is not None:
+                raw, rate = speech
+                yield audio.feed(raw, rate)
             else:
-                yield session.call("rie.dialogue.say_animated", text=reply.value, lang='en')
-
+                if audio is not None:
+                    # Let the audio queued so far finish before the robot speaks itself
+                    yield audio.close()
+                    audio = RobotAudioStream(session, chunk_seconds=PLAYBACK_CHUNK_SECONDS)
+                yield session.call("rie.dialogue.say_animated", text=sentence, lang='en')
+
+        if audio is not None:
+            yield audio.close()
+        self._mark("output_end")
+        reply = yield done
+        return reply
+
+    def _fingerprint(self, phase):
+        # What the reply opening a phase depends on. The greeting is fixed text
+        # and the conclusion prompt never looks at the conversation.
+        return (phase, self.task, self.use_daisys)
+
+    def _prepare_reply(self, phase):
+        # The reply (and audio) that opens a phase, made off the critical path.
+        # For the opening that is only the greeting's audio: what the
+        # participant actually says still goes to the LLM.
+        if phase == 0:
+            reply = OPENING_GREETING
+        else:
+            completion = _complete(self._build_messages(None, " ", phase=phase))
+            reply = completion.choices[0].message.content
+        return reply, self._prepare_audio(reply)
+
+    def _prepare_audio(self, reply):
+        # Daisys audio for each unit of reply, None when the NAO voice says it
+        if not self.use_daisys:
+            return None
+        try:
+            return [_synthesise_cached(unit) for unit in _speech_units(reply)]
         except Exception as e:
-            print("Error during interaction:", e)
-
-    yield session.call("rom.optional.behavior.play", name="BlocklyCrouch")
-    if PROMPT=="A":
-        print("Closing Sudoku interface...")
-        subprocess.Popen.terminate()
-    print("Quitting interaction loop...")
-    session.leave()
-
-
-wamp = Component(
-    transports=[{
-        "url": "ws://wamp.robotsindeklas.nl",
-        "serializers": ["msgpack"],
-        "max_retries": 0
-    }],
-    realm="rie.685cdb0798c949e6910eac04",
-)
-
-wamp.on_join(main)
-
-def choose_settings():
-    global USE_DAISYS, PROMPT
-    print("Choose a voice output:")
-    print("1. Use Daisys API (natural, cloud-based)")
-    print("2. Use default NAO robot voice")
-    choice = input("Enter 1 or 2: ").strip()
-    if choice == "1":
-        USE_DAISYS = True
-        print(">> Using Daisys API for speech.")
-    else:
-        USE_DAISYS = False
-        print(">> Using NAO robot voice.")
-
-    if USE_DAISYS:
-        init_daisys()
-
-    print("\nChoose a task:")
-    print("A. Sudoku")
-    print("B. Life Coach")
-    prompt_choice = input("Enter A or B: ").strip().upper()
-    if prompt_choice == "A":
-        PROMPT = "A"
-        print("\nLaunching Sudoku interface...")
-        subprocess.Popen([sys.executable, "sudoku.py"])
-    else:
-        PROMPT = "B"
+            print(f"[{self.name}] No speech from Daisys in time ({e}), using the NAO voice")
+            return None
+
+    def _speculate(self, phase):
+        print(f"[{self.name}] Preparing the reply for phase {phase}")
+        self.speculations[phase] = Speculation(self._fingerprint(phase),
+                                               lambda: deferToThread(self._prepare_reply, phase))
+
+    def _take_speculation(self, phase):
+        # Fires with (reply, audio), or None if nothing valid was prepared
+        speculation = self.speculations.pop(phase, None)
+        if speculation is None:
+            return succeed(None)
+        return speculation.take(self._fingerprint(phase))
+
+    @inlineCallbacks
+    def _play_prepared(self, session, reply, audio):
+        if audio is None:
+            yield session.call("rie.dialogue.say_animated", text=reply, lang='en')
+        else:
+            stream = RobotAudioStream(session, chunk_seconds=PLAYBACK_CHUNK_SECONDS)
+            for raw, rate in audio:
+                yield stream.feed(raw, rate)
+            yield stream.close()
+
+    @inlineCallbacks
+    def _say_prepared(self, session, reply, audio):
+        self._mark("output_start")
+        yield self._play_prepared(session, reply, audio)
+        self._mark("output_end")
+
+    @inlineCallbacks
+    def _conclude(self, session):
+        # Said as soon as the conclusion phase starts, without waiting for the participant
+        self.trace = self.tracer.turn(2)
+        try:
+            self._mark("phase_start")
+            prepared = yield self._take_speculation(2)
+            if prepared is None:
+                try:
+                    prepared = yield deferToThread(self._prepare_reply, 2)
+                except request_errors() as e:
+                    print(f"[{self.name}] No conclusion from the LLM in time ({e}), using a canned one")
+                    audio = yield deferToThread(self._prepare_audio, FALLBACK_CONCLUSION)
+                    prepared = (FALLBACK_CONCLUSION, audio)
+            reply, audio = prepared
+            print(f"[{self.name}] GPT-4o mini reply:", reply)
+            yield self._say_prepared(session, reply, audio)
+        finally:
+            self.tracer.finish(self.trace)
+            self.trace = None
+
+    def _compute_hint(self):
+        if self.task != "A":
+            return succeed(" ")
+        board = self.board.get_board() if self.board else None
+        if board is not None:
+            return deferToThread(generate_hint, board, self.hint_cache)
+        return deferToThread(generate_hint_from_file, self.snapshot_path, self.hint_cache)
+
+    def _set_phase(self, phase):
+        self.current_phase = phase
+        names = {1: "task", 2: "conclusion"}
+        print(f"[{self.name}] Currently in the {names[phase]} phase")
+        if phase == 2 and self.listening:
+            # Nobody is talking, so stop listening and conclude right away
+            self._getRecorder().abort()
+
+    @inlineCallbacks
+    def _turn(self, session):
+        self.trace = self.tracer.turn(self.current_phase)
+        try:
+            yield self._run_turn(session)
+        finally:
+            self.tracer.finish(self.trace)
+            self.trace = None
+        # The reply has been spoken; turns that fell out of the history
+        # window are summarised while the participant thinks of the next one
+        deferToThread(self.history.update_summary)
+
+    @inlineCallbacks
+    def _run_turn(self, session):
+        # One listen -> think -> talk cycle. The hint and the LLM connection are
+        # prepared as soon as the participant starts speaking, not after. The
+        # phase is read once: when the conclusion starts halfway through, this
+        # turn still gets its ordinary reply and the loop says goodbye after.
+        phase = self.current_phase
+        early = {}
+
+        def on_utterance_start():
+            self.listening = False
+            self._mark("speech_start")
+            early["hint"] = self._compute_hint()
+            early["board_version"] = self.board.version if self.board else None
+            early["warm_up"] = deferToThread(_warm_up_llm)
+
+        self._getRecorder().on_utterance_start = lambda: reactor.callFromThread(on_utterance_start)
+        # Marked from the recording thread, so the time is not that of the reactor
+        self._getRecorder().on_utterance_end = lambda: self._mark("capture_end")
+
+        self.listening = True
+        try:
+            user_input = yield deferToThread(self._listen, number(30))
+        finally:
+            self.listening = False
+        self._mark("asr_done")
+        self._count("speech_seconds", self._getRecorder().last_seconds)
+        print(f"[{self.name}] User said:", user_input.value)
+        if not user_input.value.strip():
+            return
+
+        if "hint" in early and (self.board is None or self.board.version == early["board_version"]):
+            hint = yield early["hint"]
+        else:
+            hint = yield self._compute_hint()
+        self._mark("hint_ready")
+
+        response = text("\nUser said: " + user_input.value)
+
+        greeting = None
+        if phase == 0:
+            # The greeting was made ready before anyone spoke. It is said
+            # while the LLM answers, which knows it has been said already.
+            greeting = yield self._take_speculation(0)
+            if greeting is not None:
+                self.history.append("assistant", greeting[0])
+
+        if STREAM_REPLIES:
+            # Thinking and talking overlap
+            reply = yield self._reply_streamed(session, response, hint, phase, lead=greeting)
+            print(f"[{self.name}] GPT-4o mini reply:", reply.value)
+            return
+
+        # Thinking
+        thinking = deferToThread(self._prompt, response, hint, phase)
+        if greeting is not None:
+            self._mark("output_start")
+            yield self._play_prepared(session, *greeting)
+        reply = yield thinking
+        print(f"[{self.name}] GPT-4o mini reply:", reply.value)
+
+        # Talking
+        # Use Daisys API for TTS instead of NAO
+        speech = None
+        if self.use_daisys:
+            print("Speaking using DAISYS")
+            speech = yield deferToThread(self.speak_with_daisys, reply.value)
+        if speech is not None:
+            raw, rate = speech
+            self._mark("output_start")
+            audio = RobotAudioStream(session, chunk_seconds=PLAYBACK_CHUNK_SECONDS)
+            yield audio.feed(raw, rate)
+            yield audio.close()
+        else:
+            self._mark("output_start")
+            yield session.call("rie.dialogue.say_animated", text=reply.value, lang='en')
+        self._mark("output_end")
+
+    @inlineCallbacks
+    def _wait_until_ready(self):
+        # Start-up work shared by all booths that may still be running
+        if "whisper" in READY:
+            try:
+                yield deferToThread(READY["whisper"].result)
+            except Exception as e:
+                # The workers are started again on first use, so the session goes on
+                print(f"[{self.name}] Whisper failed to load ({e}), retrying on the first turn")
+        if self.use_daisys and "daisys" in READY:
+            try:
+                yield deferToThread(READY["daisys"].result)
+            except Exception as e:
+                print(f"[{self.name}] Daisys login failed ({e}), using the NAO voice")
+                self.use_daisys = False
+        STARTUP.end("ready " + self.name)
+
+    @inlineCallbacks
+    def _profile_startup(self, session):
+        yield deferToThread(concurrent.futures.wait, list(READY.values()))
+        PROFILED.append(self.name)
+        if len(PROFILED) == len(SESSIONS):
+            STARTUP.report()
+        if self.sudoku_process is not None:
+            self.sudoku_process.terminate()
+        session.leave()
+
+    @inlineCallbacks
+    def main(self, session, details):
+        STARTUP.end("wamp join " + self.name)
+        self.tracer = Tracer(name=self.name)
+        ready = self._wait_until_ready()
+        if PROFILE_STARTUP:
+            yield ready
+            yield self._profile_startup(session)
+            return
+
+        yield session.call("rom.actuator.audio.volume", volume=45)
+
+        print(f"[{self.name}] Press '{self.quit_key}' at any time to quit.")
+        yield session.call("rom.optional.behavior.play", name="BlocklyStand")
+        yield ready
+        self._speculate(0)
+
+        quit_requested = Deferred()
+
+        def request_quit():
+            if not quit_requested.called:
+                quit_requested.callback(None)
+                self._getRecorder().abort()
+
+        import keyboard
+        quit_hotkey = keyboard.add_hotkey(self.quit_key, lambda: reactor.callFromThread(request_quit))
+
+        # Phase transitions are timers, not checks on every loop iteration
+        print(f"[{self.name}] Currently in the introduction phase")
+        phase_timers = [
+            reactor.callLater(PHASE_1_START, self._set_phase, 1),
+            reactor.callLater(max(PHASE_2_START - SPECULATE_LEAD, 0), self._speculate, 2),
+            reactor.callLater(PHASE_2_START, self._set_phase, 2),
+        ]
+
+        while not quit_requested.called:
+            # Once the conclusion phase starts (and any turn in progress is
+            # over) the robot says goodbye instead of listening again
+            concluding = self.current_phase == 2
+            step = self._conclude(session) if concluding else self._turn(session)
+            try:
+                # Whichever comes first: the turn finishing or the quit key
+                yield DeferredList([step, quit_requested], fireOnOneCallback=True, fireOnOneErrback=True, consumeErrors=True)
+            except Exception as e:
+                print(f"[{self.name}] Error during interaction:", e)
+            if concluding:
+                break
+
+        keyboard.remove_hotkey(quit_hotkey)
+        for timer in phase_timers:
+            if timer.active():
+                timer.cancel()
+
+        self.tracer.summary()
+        for stage in (LLM_FULL_STAGE, LLM_FIRST_TOKEN_STAGE, TTS_STAGE, SUMMARY_STAGE):
+            print(f"{stage.name}: {stage.calls} calls, {stage.hedged} hedged, {stage.expired} past the deadline")
+        yield session.call("rom.optional.behavior.play", name="BlocklyCrouch")
+        if self.sudoku_process is not None:
+            print(f"Closing Sudoku interface of {self.name}...")
+            self.sudoku_process.terminate()
+        print(f"[{self.name}] Quitting interaction loop...")
+        session.leave()
+
+
+def _in_background(phase, work, *args):
+    # Runs work on a thread of its own straight away, before the reactor is
+    # running too. Any number of sessions can wait on the returned Future.
+    future = concurrent.futures.Future()
+
+    def target():
+        STARTUP.begin(phase)
+        try:
+            future.set_result(work(*args))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            STARTUP.end(phase)
+
+    threading.Thread(target=target, name=phase, daemon=True).start()
+    return future
+
+def _login_daisys():
+    global TTS_CACHE
+    init_daisys()
+    TTS_CACHE = TTSCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
+    threading.Thread(target=prewarm_daisys, daemon=True).start()
+
+def _ask(prompt, options):
+    while True:
+        answer = input(prompt).strip().upper()
+        if answer in options:
+            return answer
+
+def parse_args(argv=None):
+    # Flags win over the environment (and the env file), anything still
+    # missing is asked for on the terminal
+    env = argparse.ArgumentParser(add_help=False)
+    env.add_argument("--env-file", default=".env", help="file with KEY=value settings and credentials")
+    known, _ = env.parse_known_args(argv)
+    from dotenv import load_dotenv
+    load_dotenv(known.env_file)
+
+    parser = argparse.ArgumentParser(description="Run the robot side of the experiment.", parents=[env])
+    parser.add_argument("--voice", choices=["daisys", "nao"], default=os.environ.get("ROBOT_VOICE"))
+    parser.add_argument("--task", choices=["A", "B"], type=str.upper, default=os.environ.get("ROBOT_TASK"),
+                        help="A is Sudoku, B is life coach")
+    parser.add_argument("--difficulty", choices=DIFFICULTIES, default=os.environ.get("ROBOT_DIFFICULTY"),
+                        help="Sudoku difficulty, drawn from " + PUZZLE_BANK)
+    parser.add_argument("--listen-mode", choices=["push_to_talk", "vad"],
+                        default=os.environ.get("ROBOT_LISTEN_MODE", LISTEN_MODE))
+    parser.add_argument("--whisper-model", default=os.environ.get("WHISPER_MODEL_SIZE", WHISPER_SETTINGS["model_size"]))
+    parser.add_argument("--asr-workers", type=int, default=int(os.environ.get("ASR_WORKERS", ASR_WORKERS)))
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report how long each start-up phase took once every robot is ready, then quit")
+    return parser.parse_args(argv)
+
+def choose_settings(args):
+    for booth in BOOTHS:
+        session = Session(**booth)
+        if len(BOOTHS) > 1 and not (args.voice and args.task):
+            print(f"\nSettings for {session.name} ({session.realm}):")
+
+        voice = args.voice
+        if voice is None:
+            print("Choose a voice output:")
+            print("1. Use Daisys API (natural, cloud-based)")
+            print("2. Use default NAO robot voice")
+            voice = "daisys" if _ask("Enter 1 or 2: ", ["1", "2"]) == "1" else "nao"
+        session.use_daisys = voice == "daisys"
+        print(f">> {session.name}: using {'Daisys API' if session.use_daisys else 'NAO robot voice'} for speech.")
+
+        # Daisys is logged in to once, in the background, whichever booths use it
+        if session.use_daisys and "daisys" not in READY:
+            READY["daisys"] = _in_background("daisys login", _login_daisys)
+
+        task = args.task
+        if task is None:
+            print("\nChoose a task:")
+            print("A. Sudoku")
+            print("B. Life Coach")
+            task = _ask("Enter A or B: ", ["A", "B"])
+        session.task = task
+        if args.difficulty is not None:
+            session.difficulty = args.difficulty
+        if task == "A":
+            session.start_sudoku()
+        SESSIONS.append(session)
 
 if __name__ == "__main__":
-    choose_settings()
-    run([wamp])
\ No newline at end of file
+    STARTUP.begin("settings")
+    args = parse_args()
+    LISTEN_MODE = args.listen_mode
+    PROFILE_STARTUP = args.profile_startup
+    WHISPER_SETTINGS["model_size"] = args.whisper_model
+    WHISPER_MODEL = ASRPool(args.asr_workers, **WHISPER_SETTINGS)
+
+    # Whisper loads and OpenAI connects while the rest of the settings are chosen
+    WHISPER_MODEL.start()
+    READY["whisper"] = _in_background("whisper load", WHISPER_MODEL.wait_ready)
+    READY["openai"] = _in_background("openai connect", _warm_up_llm)
+    choose_settings(args)
+    STARTUP.end("settings")
+
+    # Every booth holds a few pool threads at a time (listening, prompting, synthesis)
+    reactor.suggestThreadPoolSize(max(10, 8 * len(SESSIONS)))
+    for session in SESSIONS:
+        STARTUP.begin("wamp join " + session.name)
+    run([session.component() for session in SESSIONS])
@@ -1,52 +1,48 @@
+import argparse
+import sys
 import tkinter as tk
 from tkinter import messagebox
-from copy import deepcopy
+from board_sync import encode_board, encode_cell, write_board_atomic
+from sudoku_generator import DIFFICULTIES, PuzzleBank
+from sudoku_solver import BOX_OF, COL_OF, ROW_OF, UNITS, get_next_move, SolveTimeout
 
 def get_next_correct_move_from_board(board):
-    def is_valid(board, row, col, num):
-        for i in range(9):
-            if board[row][i] == num or board[i][col] == num:
-                return False
-        start_row, start_col = 3 * (row // 3), 3 * (col // 3)
-        for i in range(3):
-            for j in range(3):
-                if board[start_row + i][start_col + j] == num:
-                    return False
-        return True
-
-    def solve(board):
-        for row in range(9):
-            for col in range(9):
-                if board[row][col] == 0:
-                    for num in range(1, 10):
-                        if is_valid(board, row, col, num):
-                            board[row][col] = num
-                            if solve(board):
-                                return True
-                            board[row][col] = 0
-                    return False
-        return True
-
-    solved = deepcopy(board)
-    if not solve(solved):
+    try:
+        return get_next_move(board)
+    except SolveTimeout:
         return None
 
-    for i in range(9):
-        for j in range(9):
-            if board[i][j] == 0:
-                return (i, j, solved[i][j])
-    return None
-
 
 class SudokuUI:
-    def __init__(self, root, puzzle_file="puzzle2.txt"):
+    def __init__(self, root, puzzle_file="puzzle2.txt", channel=None, snapshot_path="sudoku_board.txt",
+                 bank=None, difficulty="medium", index=None):
         self.root = root
         self.root.title("Sudoku")
-        self.root.after(6000, self.auto_save)
+        self.channel = channel
+        self.snapshot_path = snapshot_path
+        self.snapshot_pending = False
 
         self.entries = [[None for _ in range(9)] for _ in range(9)]
-        self.puzzle = self.load_puzzle(puzzle_file)
+        self.cell_vars = [[None for _ in range(9)] for _ in range(9)]
+        if bank is not None:
+            self.puzzle = self.load_bank_puzzle(bank, difficulty, index)
+            self.root.title(f"Sudoku ({difficulty})")
+        else:
+            self.puzzle = self.load_puzzle(puzzle_file)
+        # The board as typed, kept up to date by the Entry traces so nothing
+        # has to read the widgets back. unit_counts[u][d] is how often digit d
+        # appears in unit u (9 rows, 9 columns, 9 boxes as in sudoku_solver)
+        # and clashes is the number of (unit, digit) pairs that appear twice.
+        self.board = [[0] * 9 for _ in range(9)]
+        self.unit_counts = [[0] * 10 for _ in range(27)]
+        self.clashes = 0
+        for i in range(9):
+            for j in range(9):
+                self.set_cell(i, j, self.puzzle[i][j])
         self.create_grid()
+        self.refresh_highlights(range(27))
+        self.push(encode_board(self.board))
+        self.schedule_snapshot()
 
         check_button = tk.Button(self.root, text="Check Validity", command=self.check_valid)
         check_button.pack(pady=5)
@@ -66,6 +62,11 @@ class SudokuUI:
             raise ValueError("Puzzle must have exactly 9 lines")
         return puzzle
 
+    def load_bank_puzzle(self, path, difficulty, index=None):
+        # A generated puzzle from a bank written by sudoku_generator.py,
+        # a random one of that difficulty unless index is given
+        return PuzzleBank(path).puzzle(difficulty, index)
+
     def create_grid(self):
         board_frame = tk.Frame(self.root, bg="black")
         board_frame.pack(padx=10, pady=10)
@@ -77,61 +78,105 @@ class SudokuUI:
                 frame.grid(row=block_row, column=block_col, padx=2, pady=2)
                 block_frames[block_row][block_col] = frame
 
+        # Only an empty cell or a single digit 1-9 can be typed
+        digit_only = self.root.register(lambda value: value == "" or (len(value) == 1 and value in "123456789"))
+
         for i in range(9):
             for j in range(9):
                 block_row, block_col = i // 3, j // 3
                 val = self.puzzle[i][j]
+                var = tk.StringVar()
                 entry = tk.Entry(
                     block_frames[block_row][block_col],
+                    textvariable=var,
                     width=2,
                     font=('Arial', 18),
                     justify='center',
                     bd=1,
                     relief='solid',
-                    disabledforeground="black"
+                    disabledforeground="black",
+                    validate='key',
+                    validatecommand=(digit_only, '%P')
                 )
                 if val != 0:
-                    entry.insert(0, str(val))
+                    var.set(str(val))
                     entry.config(state='disabled')
                 entry.grid(row=i % 3, column=j % 3, padx=1, pady=1)
+                var.trace_add("write", lambda *args, i=i, j=j: self.on_cell_change(i, j))
                 self.entries[i][j] = entry
+                self.cell_vars[i][j] = var
+
+    def on_cell_change(self, i, j):
+        val = self.cell_vars[i][j].get().strip()
+        num = int(val) if len(val) == 1 and val in "123456789" else 0
+        if num == self.board[i][j]:
+            return
+        self.set_cell(i, j, num)
+        self.refresh_highlights((ROW_OF[i * 9 + j], 9 + COL_OF[i * 9 + j], 18 + BOX_OF[i * 9 + j]))
+        self.push(encode_cell(i, j, num))
+        self.schedule_snapshot()
+
+    def set_cell(self, i, j, num):
+        # Move the cell's old and new digit through the counts of its three units
+        cell = i * 9 + j
+        old = self.board[i][j]
+        self.board[i][j] = num
+        for unit in (ROW_OF[cell], 9 + COL_OF[cell], 18 + BOX_OF[cell]):
+            counts = self.unit_counts[unit]
+            if old:
+                counts[old] -= 1
+                if counts[old] == 1:
+                    self.clashes -= 1
+            if num:
+                counts[num] += 1
+                if counts[num] == 2:
+                    self.clashes += 1
+
+    def is_clashing(self, i, j):
+        num = self.board[i][j]
+        if not num:
+            return False
+        cell = i * 9 + j
+        return (self.unit_counts[ROW_OF[cell]][num] > 1
+                or self.unit_counts[9 + COL_OF[cell]][num] > 1
+                or self.unit_counts[18 + BOX_OF[cell]][num] > 1)
+
+    def refresh_highlights(self, units):
+        # Recolour only the cells of the units that just changed
+        for cell in {cell for unit in units for cell in UNITS[unit]}:
+            i, j = divmod(cell, 9)
+            colour = "#f4a6a6" if self.is_clashing(i, j) else "white"
+            self.entries[i][j].config(bg=colour, disabledbackground=colour)
+
+    def push(self, message):
+        if self.channel is None:
+            return
+        try:
+            self.channel.write(message)
+            self.channel.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            # Controller went away, keep the UI usable on its own
+            self.channel = None
 
     def get_board(self):
-        board = []
-        for i in range(9):
-            row = []
-            for j in range(9):
-                val = self.entries[i][j].get()
-                row.append(int(val) if val.isdigit() else 0)
-            board.append(row)
-        return board
+        return [row[:] for row in self.board]
 
     def check_valid(self):
-        board = self.get_board()
-        if self.is_valid_sudoku(board):
+        if self.is_valid_sudoku():
             messagebox.showinfo("Result", "This is a valid Sudoku board so far!")
         else:
             messagebox.showwarning("Result", "Invalid Sudoku setup!")
 
-    def is_valid_sudoku(self, board):
+    def is_valid_sudoku(self, board=None):
+        # The board on screen is answered from the unit counts
+        if board is None:
+            return self.clashes == 0
+
         def is_valid_block(block):
             nums = [n for n in block if n != 0]
             return len(nums) == len(set(nums))
 
-        for i in range(9):
-            row = board[i]
-            col = [board[j][i] for j in range(9)]
-            if not is_valid_block(row) or not is_valid_block(col):
-                return False
-
-        for i in range(3):
-            for j in range(3):
-                block = [board[x][y] for x in range(i * 3, i * 3 + 3)
-                                       for y in range(j * 3, j * 3 + 3)]
-                if not is_valid_block(block):
-                    return False
-
-        return True
+        return all(is_valid_block([board[cell // 9][cell % 9] for cell in unit]) for unit in UNITS)
 
     def get_sudoku_context(self):
         board = self.get_board()
@@ -141,18 +186,40 @@ class SudokuUI:
         return context
 
     def save_board_to_file(self, path="sudoku_board.txt"):
-        board = self.get_board()
-        with open(path, "w") as f:
-            for row in board:
-                f.write("".join(str(num) for num in row) + "\n")
+        write_board_atomic(self.board, path)
 
-    def auto_save(self):
-        self.save_board_to_file()
-        print("Board saved!")
-        self.root.after(6000, self.auto_save)
+    def schedule_snapshot(self):
+        # Coalesce bursts of typing into one write, and only write on change
+        if self.snapshot_path is None or self.snapshot_pending:
+            return
+        self.snapshot_pending = True
+        self.root.after(500, self.take_snapshot)
+
+    def take_snapshot(self):
+        self.snapshot_pending = False
+        self.save_board_to_file(self.snapshot_path)
+        print("Board saved!", file=sys.stderr)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--puzzle", default="puzzle2.txt")
+    parser.add_argument("--bank", help="puzzle bank from sudoku_generator.py, used instead of --puzzle")
+    parser.add_argument("--difficulty", choices=DIFFICULTIES, default="medium")
+    parser.add_argument("--index", type=int, help="puzzle number within the difficulty, random if left out")
+    parser.add_argument("--push", action="store_true", help="push board changes to stdout for the controller")
+    parser.add_argument("--snapshot", default="sudoku_board.txt", help="file to keep a copy of the board in")
+    parser.add_argument("--no-snapshot", action="store_true")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = SudokuUI(root, puzzle_file="puzzle2.txt")
+    app = SudokuUI(
+        root,
+        puzzle_file=args.puzzle,
+        channel=sys.stdout if args.push else None,
+        snapshot_path=None if args.no_snapshot else args.snapshot,
+        bank=args.bank,
+        difficulty=args.difficulty,
+        index=args.index
+    )
     root.mainloop()
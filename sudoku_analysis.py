@@ -0,0 +1,134 @@
+import numpy as np
+from sudoku_solver import solve, SolveTimeout
+
+# Batch hint analysis for many boards at once. Boards are an (N, 9, 9) int
+# array with 0 for empty cells; candidates are an (N, 9, 9, 9) bool array
+# where [n, r, c, d] says digit d+1 can still go in cell (r, c) of board n.
+
+# Human techniques, from easiest to hardest to spot
+TECHNIQUES = ["hidden_single_box", "hidden_single_row", "hidden_single_col", "naked_single", "search"]
+
+DIGITS = np.arange(1, 10)
+
+
+def _box_spread(per_box):
+    # (N, 3, 3, 9) per-box values -> (N, 9, 9, 9) per-cell values
+    return per_box.repeat(3, axis=1).repeat(3, axis=2)
+
+
+def candidate_masks(boards):
+    boards = np.asarray(boards)
+    placed = boards[..., None] == DIGITS
+    n = len(boards)
+    row_used = placed.any(axis=2)
+    col_used = placed.any(axis=1)
+    box_used = placed.reshape(n, 3, 3, 3, 3, 9).any(axis=(2, 4))
+    used = row_used[:, :, None, :] | col_used[:, None, :, :] | _box_spread(box_used)
+    return ~used & (boards == 0)[..., None]
+
+
+def conflicts(boards):
+    # True for boards with a digit twice in some row, column or box
+    boards = np.asarray(boards)
+    placed = boards[..., None] == DIGITS
+    n = len(boards)
+    return ((placed.sum(axis=2) > 1).any(axis=(1, 2))
+            | (placed.sum(axis=1) > 1).any(axis=(1, 2))
+            | (placed.reshape(n, 3, 3, 3, 3, 9).sum(axis=(2, 4)) > 1).any(axis=(1, 2, 3)))
+
+
+def single_moves(cands):
+    """Every forced placement on every board, by technique.
+
+    Returns {technique: (board, row, col, digit) index arrays} with digits 1-9.
+    """
+    n = len(cands)
+    counts = cands.sum(axis=3)
+    moves = {}
+
+    b, r, c = np.nonzero(counts == 1)
+    moves["naked_single"] = (b, r, c, cands[b, r, c].argmax(axis=1) + 1)
+
+    # A digit with exactly one possible cell in a row / column / box
+    b, r, d = np.nonzero(cands.sum(axis=2) == 1)
+    moves["hidden_single_row"] = (b, r, cands[b, r, :, d].argmax(axis=1), d + 1)
+
+    b, c, d = np.nonzero(cands.sum(axis=1) == 1)
+    moves["hidden_single_col"] = (b, cands[b, :, c, d].argmax(axis=1), c, d + 1)
+
+    boxes = cands.reshape(n, 3, 3, 3, 3, 9).transpose(0, 1, 3, 2, 4, 5).reshape(n, 3, 3, 9, 9)
+    b, br, bc, d = np.nonzero(boxes.sum(axis=3) == 1)
+    k = boxes[b, br, bc, :, d].argmax(axis=1)
+    moves["hidden_single_box"] = (b, br * 3 + k // 3, bc * 3 + k % 3, d + 1)
+    return moves
+
+
+def analyse_boards(boards, solutions=None, max_hints=3):
+    """Ranked hints for each of N boards.
+
+    Returns one dict per board with "status" ("ok", "complete", "invalid"
+    or "unsolvable"), "candidates" (the (9, 9, 9) mask) and "hints": up to
+    max_hints dicts of row, col, value, technique and the number of
+    candidates left in that cell, easiest technique first. When no single
+    is available the hint is the cell with fewest candidates, filled in
+    from solutions (an (N, 9, 9) array) or from solving the board.
+    """
+    boards = np.asarray(boards, dtype=np.int8)
+    cands = candidate_masks(boards)
+    counts = cands.sum(axis=3)
+    invalid = conflicts(boards)
+    empty = boards == 0
+    dead = (empty & (counts == 0)).any(axis=(1, 2))
+
+    per_board = [dict() for _ in range(len(boards))]
+    for rank, technique in enumerate(TECHNIQUES[:-1]):
+        b, r, c, d = single_moves(cands)[technique]
+        for i in range(len(b)):
+            seen = per_board[b[i]]
+            key = (int(r[i]), int(c[i]))
+            if key not in seen:
+                seen[key] = (rank, int(d[i]), technique)
+
+    results = []
+    for n in range(len(boards)):
+        result = {"status": "ok", "candidates": cands[n], "hints": []}
+        results.append(result)
+        if invalid[n]:
+            result["status"] = "invalid"
+            continue
+        if not empty[n].any():
+            result["status"] = "complete"
+            continue
+        if dead[n]:
+            result["status"] = "unsolvable"
+            continue
+
+        ranked = sorted(per_board[n].items(), key=lambda item: (item[1][0], item[0]))
+        for (r, c), (rank, value, technique) in ranked[:max_hints]:
+            result["hints"].append({"row": r, "col": c, "value": value,
+                                    "technique": technique, "candidates": int(counts[n, r, c])})
+        if result["hints"]:
+            continue
+
+        if solutions is not None:
+            solution = solutions[n]
+        else:
+            try:
+                solution = solve(boards[n].tolist())
+            except SolveTimeout:
+                solution = None
+        if solution is None:
+            result["status"] = "unsolvable"
+            continue
+        fewest = np.where(empty[n], counts[n], 10)
+        r, c = np.unravel_index(fewest.argmin(), fewest.shape)
+        result["hints"].append({"row": int(r), "col": int(c), "value": int(solution[r][c]),
+                                "technique": "search", "candidates": int(counts[n, r, c])})
+    return results
+
+
+def difficulty(result):
+    # Hardest technique the easiest next move needs, as an index into TECHNIQUES
+    if not result["hints"]:
+        return None
+    return TECHNIQUES.index(result["hints"][0]["technique"])
@@ -1,47 +1,117 @@
-from copy import deepcopy
+import os
+from sudoku_solver import solve, SolveTimeout
+from sudoku_analysis import analyse_boards
 
-def generate_hint_from_file(puzzle_file="sudoku_board.txt"):
-    def is_valid(board, row, col, num):
-        for i in range(9):
-            if board[row][i] == num or board[i][col] == num:
-                return False
-        start_row, start_col = 3 * (row // 3), 3 * (col // 3)
-        for i in range(3):
-            for j in range(3):
-                if board[start_row + i][start_col + j] == num:
-                    return False
-        return True
-
-    def solve(board):
-        for row in range(9):
-            for col in range(9):
-                if board[row][col] == 0:
-                    for num in range(1, 10):
-                        if is_valid(board, row, col, num):
-                            board[row][col] = num
-                            if solve(board):
-                                return True
-                            board[row][col] = 0
-                    return False
-        return True
 
+class HintCache:
+    # Remembers the last board seen and the solution it was solved to, so a
+    # participant filling in correct cells never costs another solve.
+    def __init__(self):
+        self.file_stamp = None
+        self.board_key = None
+        self.hint = None
+        self.solution = None
+        self.solves = 0
+
+
+_hint_cache = HintCache()
+
+
+def board_key(board):
+    return "".join(str(d) for row in board for d in row)
+
+
+def read_board(puzzle_file="sudoku_board.txt"):
     with open(puzzle_file, "r") as f:
         lines = f.readlines()
 
     board = []
-    context = ""
     for line in lines:
         digits = [int(c) for c in line.strip() if c.isdigit()]
         board.append(digits)
-        context += " ".join(str(c) if c != 0 else "_" for c in digits) + "\n"
+    return board
 
-    solved = deepcopy(board)
-    if not solve(solved):
-        return "No hints available. Puzzle may be complete or unsolvable."
 
+def _matches_solution(board, solution):
     for i in range(9):
         for j in range(9):
-            if board[i][j] == 0:
-                return "A correct move is to place" + str(solved[i][j]) + " row " + str(i+1) + ", column " + str(j+1) + " other moves are allowed too, but you can't guarantee those are correct. The board looks like this: " + str(context)
+            if board[i][j] != 0 and board[i][j] != solution[i][j]:
+                return False
+    return True
+
+
+def _board_context(board):
+    context = ""
+    for row in board:
+        context += " ".join(str(c) if c != 0 else "_" for c in row) + "\n"
+    return context
+
+
+REASONS = {
+    "hidden_single_box": "it is the only place in its 3x3 box where a {value} fits",
+    "hidden_single_row": "it is the only place in row {row} where a {value} fits",
+    "hidden_single_col": "it is the only place in column {col} where a {value} fits",
+    "naked_single": "{value} is the only number that fits in that cell",
+    "search": "that cell has the fewest options left ({candidates}), though it takes some trial and error to see why",
+}
+
+
+def _format_hint(board, solved):
+    context = _board_context(board)
+
+    analysis = analyse_boards([board], solutions=[solved], max_hints=1)[0]
+    if analysis["status"] == "complete":
+        return "No empty cells found."
+    if not analysis["hints"]:
+        return "No hints available. Puzzle may be complete or unsolvable."
+
+    hint = analysis["hints"][0]
+    row, col, value = hint["row"] + 1, hint["col"] + 1, hint["value"]
+    reason = REASONS[hint["technique"]].format(row=row, col=col, value=value, candidates=hint["candidates"])
+    return "A correct move is to place " + str(value) + " in row " + str(row) + ", column " + str(col) + ", because " + reason + ". Other moves are allowed too, but you can't guarantee those are correct. The board looks like this: " + str(context)
+
+
+def generate_hint(board, cache=None):
+    if cache is None:
+        cache = _hint_cache
+
+    if len(board) != 9 or any(len(row) != 9 for row in board):
+        return "No hints available. The board file is incomplete."
+
+    key = board_key(board)
+    if key == cache.board_key:
+        return cache.hint
+
+    if cache.solution is None or not _matches_solution(board, cache.solution):
+        try:
+            solved = solve(board)
+        except SolveTimeout:
+            return "No hint could be worked out in time. The board looks like this: " + _board_context(board)
+        cache.solves += 1
+        if solved is None:
+            cache.solution = None
+            cache.board_key = key
+            cache.hint = "No hints available. Puzzle may be complete or unsolvable."
+            return cache.hint
+        cache.solution = solved
+
+    cache.board_key = key
+    cache.hint = _format_hint(board, cache.solution)
+    return cache.hint
+
+
+def generate_hint_from_file(puzzle_file="sudoku_board.txt", cache=None):
+    if cache is None:
+        cache = _hint_cache
+
+    # Skip the read and parse entirely while the file is untouched
+    st = os.stat(puzzle_file)
+    stamp = (puzzle_file, st.st_mtime_ns, st.st_size)
+    if stamp == cache.file_stamp and cache.hint is not None:
+        return cache.hint
 
-    return "No empty cells found."
\ No newline at end of file
+    board = read_board(puzzle_file)
+    hint = generate_hint(board, cache)
+    if cache.board_key == board_key(board):
+        cache.file_stamp = stamp
+    return hint
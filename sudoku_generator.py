@@ -0,0 +1,225 @@
+"""Generate Sudoku puzzles with a single solution, grade them and bank them.
+
+Run from the repository root:
+
+    python sudoku_generator.py --count 2000 --out puzzles.bank
+
+Each puzzle starts from a random solved grid; cells are emptied in random
+order as long as count_solutions() (which stops at the second solution)
+still finds exactly one. Puzzles are generated in batches across a
+process pool and graded together with the techniques of sudoku_analysis.
+The bank is a small header and level table followed by fixed-size
+records (81 cell bytes plus grade, clue and step counts), sorted by
+difficulty, so PuzzleBank can hand out a puzzle of any level without
+reading the whole file.
+"""
+import argparse
+import os
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from sudoku_analysis import TECHNIQUES, candidate_masks, single_moves
+from sudoku_solver import count_solutions, solve
+
+DIFFICULTIES = ["easy", "medium", "hard", "expert"]
+
+# Hardest technique a human needs to finish the puzzle -> difficulty
+LEVEL_OF_TECHNIQUE = {
+    "hidden_single_box": 0,
+    "hidden_single_row": 1,
+    "hidden_single_col": 1,
+    "naked_single": 2,
+    "search": 3,
+}
+
+BANK_MAGIC = b"SDKB"
+BANK_VERSION = 1
+HEADER = struct.Struct("<4sBBHI")  # magic, version, levels, reserved, count
+LEVEL_ENTRY = struct.Struct("<II")  # first record, records
+RECORD = np.dtype([("cells", "u1", 81), ("level", "u1"), ("clues", "u1"), ("steps", "u1")])
+
+
+def random_solution(rng):
+    # The three diagonal boxes do not share a row or column, so any filling
+    # of them can be completed; the solver does the rest.
+    while True:
+        board = [[0] * 9 for _ in range(9)]
+        for box in range(3):
+            digits = rng.sample(range(1, 10), 9)
+            for k, d in enumerate(digits):
+                board[box * 3 + k // 3][box * 3 + k % 3] = d
+        solved = solve(board, time_limit=None)
+        if solved is not None:
+            return solved
+
+
+def _forced(board, r, c):
+    br, bc = r - r % 3, c - c % 3
+    seen = set(board[r]) | {board[i][c] for i in range(9)} \
+        | {board[i][j] for i in range(br, br + 3) for j in range(bc, bc + 3)}
+    return len(seen - {0}) == 8
+
+
+def make_puzzle(solution, rng, min_clues=22, max_clues=34):
+    """Empty cells of solution while the puzzle stays uniquely solvable.
+
+    Stops at a random clue count between min_clues and max_clues, or
+    earlier if no further cell can go without a second solution appearing.
+    """
+    puzzle = [row[:] for row in solution]
+    target = rng.randint(min_clues, max_clues)
+    clues = 81
+    cells = list(range(81))
+    rng.shuffle(cells)
+    for cell in cells:
+        if clues <= target:
+            break
+        r, c = divmod(cell, 9)
+        puzzle[r][c] = 0
+        # A cell whose value is still forced by its row, column and box
+        # cannot open up a second solution, no need to search
+        if _forced(puzzle, r, c) or count_solutions(puzzle, limit=2) == 1:
+            clues -= 1
+        else:
+            puzzle[r][c] = solution[r][c]
+    return puzzle
+
+
+def grade_boards(puzzles, solutions):
+    """Difficulty level, clue count and solving steps for each puzzle.
+
+    All puzzles are solved side by side the way a person would: every
+    step applies all placements of the easiest technique available on
+    that board. When no single is left the cell with the fewest
+    candidates is filled from the solution, which grades it as search.
+    """
+    boards = np.array(puzzles, dtype=np.int8)
+    solutions = np.asarray(solutions, dtype=np.int8)
+    n = len(boards)
+    clues = (boards != 0).sum(axis=(1, 2))
+    hardest = np.zeros(n, dtype=np.int8)
+    steps = np.zeros(n, dtype=np.int32)
+    ranks = np.array([LEVEL_OF_TECHNIQUE[t] for t in TECHNIQUES])
+
+    active = np.nonzero((boards == 0).any(axis=(1, 2)))[0]
+    while len(active):
+        cands = candidate_masks(boards[active])
+        moves = single_moves(cands)
+        applied = np.zeros(len(active), dtype=bool)
+        for rank, technique in enumerate(TECHNIQUES[:-1]):
+            b, r, c, d = moves[technique]
+            fresh = ~applied[b]
+            b, r, c, d = b[fresh], r[fresh], c[fresh], d[fresh]
+            boards[active[b], r, c] = d
+            used = np.unique(b)
+            hardest[active[used]] = np.maximum(hardest[active[used]], ranks[rank])
+            applied[used] = True
+
+        stuck = np.nonzero(~applied)[0]
+        if len(stuck):
+            counts = np.where(boards[active[stuck]] == 0, cands[stuck].sum(axis=3), 10)
+            flat = counts.reshape(len(stuck), 81).argmin(axis=1)
+            r, c = flat // 9, flat % 9
+            boards[active[stuck], r, c] = solutions[active[stuck], r, c]
+            hardest[active[stuck]] = ranks[-1]
+
+        steps[active] += 1
+        active = active[(boards[active] == 0).any(axis=(1, 2))]
+    return hardest, clues, steps
+
+
+def generate_batch(count, seed, min_clues=22, max_clues=34):
+    # One process pool task: count graded puzzles as an array of RECORDs
+    rng = random.Random(seed)
+    puzzles = []
+    solutions = []
+    for _ in range(count):
+        solution = random_solution(rng)
+        puzzles.append(make_puzzle(solution, rng, min_clues, max_clues))
+        solutions.append(solution)
+
+    records = np.zeros(count, dtype=RECORD)
+    records["cells"] = np.array(puzzles, dtype=np.uint8).reshape(count, 81)
+    records["level"], records["clues"], records["steps"] = grade_boards(puzzles, solutions)
+    return records
+
+
+def generate(count, workers=None, batch_size=50, seed=None, min_clues=22, max_clues=34):
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    sizes = [min(batch_size, count - start) for start in range(0, count, batch_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        batches = pool.map(generate_batch, sizes, [seed + i for i in range(len(sizes))],
+                           [min_clues] * len(sizes), [max_clues] * len(sizes))
+        return np.concatenate(list(batches)) if sizes else np.zeros(0, dtype=RECORD)
+
+
+def write_bank(path, records):
+    records = records[np.argsort(records["level"], kind="stable")]
+    levels = np.bincount(records["level"], minlength=len(DIFFICULTIES))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(BANK_MAGIC, BANK_VERSION, len(DIFFICULTIES), 0, len(records)))
+        first = 0
+        for size in levels:
+            f.write(LEVEL_ENTRY.pack(first, int(size)))
+            first += int(size)
+        records.tofile(f)
+    os.replace(tmp_path, path)
+    return levels
+
+
+class PuzzleBank:
+    """Read access to a bank written by write_bank().
+
+    The records are memory-mapped, so opening the bank and picking a
+    puzzle cost the same however many puzzles it holds.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, version, levels, _, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != BANK_MAGIC or version != BANK_VERSION:
+                raise ValueError("Not a puzzle bank: " + path)
+            self.levels = [LEVEL_ENTRY.unpack(f.read(LEVEL_ENTRY.size)) for _ in range(levels)]
+        offset = HEADER.size + LEVEL_ENTRY.size * levels
+        self.records = np.memmap(path, dtype=RECORD, mode="r", offset=offset, shape=(count,)) \
+            if count else np.zeros(0, dtype=RECORD)
+
+    def __len__(self):
+        return len(self.records)
+
+    def count(self, difficulty):
+        return self.levels[DIFFICULTIES.index(difficulty)][1]
+
+    def puzzle(self, difficulty, index=None, rng=random):
+        """A puzzle of the given difficulty as a 9x9 list, a random one unless index is given."""
+        first, size = self.levels[DIFFICULTIES.index(difficulty)]
+        if not size:
+            raise LookupError(f"No {difficulty} puzzles in the bank")
+        if index is None:
+            index = rng.randrange(size)
+        cells = self.records["cells"][first + index % size].tolist()
+        return [cells[r * 9:r * 9 + 9] for r in range(9)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--out", default="puzzles.bank")
+    parser.add_argument("--workers", type=int, default=None, help="processes, defaults to one per CPU")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--min-clues", type=int, default=22)
+    parser.add_argument("--max-clues", type=int, default=34)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    records = generate(args.count, args.workers, args.batch_size, args.seed, args.min_clues, args.max_clues)
+    levels = write_bank(args.out, records)
+    took = time.perf_counter() - start
+    print(f"{len(records)} puzzles in {took:.1f}s ({len(records) / took:.0f}/s), written to {args.out}")
+    for name, size in zip(DIFFICULTIES, levels):
+        print(f"  {name:8} {size}")
@@ -0,0 +1,198 @@
+import time
+
+# Shared solver used by the Sudoku UI and the hint generator.
+# Every row, column and box keeps a bitmask of the digits it already holds
+# (bit d-1 set means digit d is used), so the candidates of a cell are one
+# OR and one NOT away instead of a rescan of 27 cells per digit.
+
+SOLVE_TIME_LIMIT = 0.5  # seconds per solve, keeps hints off the critical path
+
+ALL_DIGITS = 0x1FF
+
+ROW_OF = [i // 9 for i in range(81)]
+COL_OF = [i % 9 for i in range(81)]
+BOX_OF = [(i // 27) * 3 + (i % 9) // 3 for i in range(81)]
+
+UNITS = (
+    [[r * 9 + c for c in range(9)] for r in range(9)]
+    + [[r * 9 + c for r in range(9)] for c in range(9)]
+    + [[(b // 3) * 27 + (b % 3) * 3 + (k // 3) * 9 + k % 3 for k in range(9)] for b in range(9)]
+)
+
+DIGIT_OF = {1 << (d - 1): d for d in range(1, 10)}
+BIT_COUNT = [bin(m).count("1") for m in range(ALL_DIGITS + 1)]
+
+
+class SolveTimeout(Exception):
+    pass
+
+
+class _Search:
+    def __init__(self, board, deadline=None, limit=1):
+        self.cells = [0] * 81
+        self.rows = [0] * 9
+        self.cols = [0] * 9
+        self.boxes = [0] * 9
+        self.trail = []
+        self.deadline = deadline
+        self.limit = limit
+        self.nodes = 0
+        self.solutions = []
+        self.consistent = True
+
+        for r in range(9):
+            for c in range(9):
+                d = board[r][c]
+                if d and not self.place(r * 9 + c, d):
+                    self.consistent = False
+                    return
+
+    def candidates(self, i):
+        return ALL_DIGITS & ~(self.rows[ROW_OF[i]] | self.cols[COL_OF[i]] | self.boxes[BOX_OF[i]])
+
+    def place(self, i, d):
+        bit = 1 << (d - 1)
+        if not self.candidates(i) & bit:
+            return False
+        self.cells[i] = d
+        self.rows[ROW_OF[i]] |= bit
+        self.cols[COL_OF[i]] |= bit
+        self.boxes[BOX_OF[i]] |= bit
+        self.trail.append(i)
+        return True
+
+    def undo(self, mark):
+        while len(self.trail) > mark:
+            i = self.trail.pop()
+            bit = ~(1 << (self.cells[i] - 1))
+            self.cells[i] = 0
+            self.rows[ROW_OF[i]] &= bit
+            self.cols[COL_OF[i]] &= bit
+            self.boxes[BOX_OF[i]] &= bit
+
+    def propagate(self):
+        # Naked and hidden singles until nothing changes. False on contradiction.
+        changed = True
+        while changed:
+            changed = False
+            for i in range(81):
+                if self.cells[i]:
+                    continue
+                cand = self.candidates(i)
+                if not cand:
+                    return False
+                if BIT_COUNT[cand] == 1:
+                    self.place(i, DIGIT_OF[cand])
+                    changed = True
+
+            for unit in UNITS:
+                seen_once = 0
+                seen_twice = 0
+                placed = 0
+                for i in unit:
+                    if self.cells[i]:
+                        placed |= 1 << (self.cells[i] - 1)
+                        continue
+                    cand = self.candidates(i)
+                    seen_twice |= seen_once & cand
+                    seen_once |= cand
+                if (seen_once | placed) != ALL_DIGITS:
+                    return False
+                hidden = seen_once & ~seen_twice & ~placed
+                while hidden:
+                    bit = hidden & -hidden
+                    hidden ^= bit
+                    for i in unit:
+                        if not self.cells[i] and self.candidates(i) & bit:
+                            if not self.place(i, DIGIT_OF[bit]):
+                                return False
+                            changed = True
+                            break
+        return True
+
+    def search(self):
+        self.nodes += 1
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SolveTimeout()
+
+        mark = len(self.trail)
+        if not self.propagate():
+            self.undo(mark)
+            return False
+
+        # Most constrained cell first
+        best = -1
+        best_count = 10
+        for i in range(81):
+            if not self.cells[i]:
+                count = BIT_COUNT[self.candidates(i)]
+                if count < best_count:
+                    best, best_count = i, count
+                    if count == 2:
+                        break
+
+        if best == -1:
+            self.solutions.append([self.cells[r * 9:r * 9 + 9] for r in range(9)])
+            self.undo(mark)
+            return len(self.solutions) >= self.limit
+
+        cand = self.candidates(best)
+        while cand:
+            bit = cand & -cand
+            cand ^= bit
+            inner = len(self.trail)
+            self.place(best, DIGIT_OF[bit])
+            if self.search():
+                self.undo(mark)
+                return True
+            self.undo(inner)
+
+        self.undo(mark)
+        return False
+
+
+def _deadline(time_limit):
+    if time_limit is None:
+        return None
+    return time.perf_counter() + time_limit
+
+
+def solve(board, time_limit=SOLVE_TIME_LIMIT):
+    """Return a solved copy of board, or None if it has no solution.
+
+    Raises SolveTimeout when the solve takes longer than time_limit seconds.
+    """
+    search = _Search(board, _deadline(time_limit))
+    if not search.consistent or not search.search():
+        return None
+    return search.solutions[0]
+
+
+def solve_with_stats(board, time_limit=SOLVE_TIME_LIMIT):
+    """Like solve(), but returns (solution, nodes searched) for benchmarking."""
+    search = _Search(board, _deadline(time_limit))
+    if not search.consistent or not search.search():
+        return None, search.nodes
+    return search.solutions[0], search.nodes
+
+
+def count_solutions(board, limit=2, time_limit=None):
+    """Count solutions of board, stopping as soon as limit is reached."""
+    search = _Search(board, _deadline(time_limit), limit)
+    if not search.consistent:
+        return 0
+    search.search()
+    return len(search.solutions)
+
+
+def get_next_move(board, time_limit=SOLVE_TIME_LIMIT):
+    """First empty cell in row-major order with its solved value, as (row, col, value)."""
+    solved = solve(board, time_limit)
+    if solved is None:
+        return None
+
+    for i in range(9):
+        for j in range(9):
+            if board[i][j] == 0:
+                return (i, j, solved[i][j])
+    return None